@@ -1,7 +1,17 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from api.models import Order, Item, OrderItem, Customer, User
+from api.models import (
+    Order,
+    Item,
+    ItemPrice,
+    OrderItem,
+    Customer,
+    DailyCustomerSales,
+    DailyItemSales,
+    Receipt,
+    User,
+)
 
 admin.site.register(User, UserAdmin)
 
@@ -21,6 +31,28 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ("order", "item", "quantity", "price", "unit")
 
 
+class ItemPriceInline(admin.TabularInline):
+    model = ItemPrice
+    extra = 0
+    ordering = ("-effective_on",)
+
+
 @admin.register(Item)
 class ItemAdmin(admin.ModelAdmin):
     list_display = ("name", "default_price")
+    inlines = [ItemPriceInline]
+
+
+@admin.register(Receipt)
+class ReceiptAdmin(admin.ModelAdmin):
+    list_display = ("order", "version", "state", "created_on", "rendered_on")
+
+
+@admin.register(DailyCustomerSales)
+class DailyCustomerSalesAdmin(admin.ModelAdmin):
+    list_display = ("day", "customer", "orders", "lines", "revenue")
+
+
+@admin.register(DailyItemSales)
+class DailyItemSalesAdmin(admin.ModelAdmin):
+    list_display = ("day", "customer", "item", "unit", "quantity", "revenue")
@@ -0,0 +1,93 @@
+"""
+Token authentication served from a per process cache instead of a join of
+authtoken_token and api_user on every request. Entries live for
+TOKEN_CACHE_TIMEOUT seconds, signals in api.signals drop them as soon as a
+token is rotated or deleted or its user changes, the timeout bounds how long
+other worker processes can accept a revoked token.
+"""
+from datetime import timedelta
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.models import User
+
+# token key -> (expires at, user id, db alias, user field values, token created)
+_cache = {}
+_lock = threading.Lock()
+
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+
+
+def token_expires_on(created):
+    """When a token created at `created` stops being accepted, None for never"""
+    if not settings.TOKEN_EXPIRY_SECONDS:
+        return None
+    return created + timedelta(seconds=settings.TOKEN_EXPIRY_SECONDS)
+
+
+def token_expired(created):
+    expires_on = token_expires_on(created)
+    return expires_on is not None and expires_on <= timezone.now()
+
+
+def _load(key):
+    token = Token.objects.select_related("user").filter(key=key).first()
+    if token is None:
+        return None
+    user = token.user
+    values = tuple(getattr(user, name) for name in USER_FIELDS)
+    return user.pk, user._state.db, values, token.created
+
+
+def resolve_token(key):
+    """Token, with its user, for a valid key, AuthenticationFailed otherwise"""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and entry[0] > now:
+        loaded = entry[1:]
+    else:
+        loaded = _load(key)
+        if loaded is None:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+        with _lock:
+            _cache[key] = (now + settings.TOKEN_CACHE_TIMEOUT, *loaded)
+
+    db, values, created = loaded[1:]
+    if token_expired(created):
+        raise exceptions.AuthenticationFailed(_("Token has expired."))
+    # a fresh instance per request, nothing memoized on it outlives the request
+    user = User.from_db(db, USER_FIELDS, values)
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+    return Token(key=key, user=user, created=created)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        token = resolve_token(key)
+        return token.user, token
+
+
+def invalidate(*keys):
+    with _lock:
+        for key in keys:
+            _cache.pop(key, None)
+
+
+def invalidate_user(user_id):
+    with _lock:
+        for key in [key for key, entry in _cache.items() if entry[1] == user_id]:
+            del _cache[key]
+
+
+def invalidate_all():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,151 @@
+import socket
+import threading
+from time import perf_counter, sleep
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, round(percent / 100 * len(samples)) - 1))
+    return samples[rank]
+
+
+class Measurement:
+    def __init__(self, name):
+        self.name = name
+        self.timings = []
+        self.queries = []
+        self.statuses = set()
+
+    def record(self, seconds, queries, status=None):
+        self.timings.append(seconds * 1000)
+        self.queries.append(queries)
+        if status is not None:
+            self.statuses.add(status)
+
+    def summary(self):
+        timings = sorted(self.timings)
+        return {
+            "name": self.name,
+            "runs": len(timings),
+            "p50": percentile(timings, 50),
+            "p95": percentile(timings, 95),
+            "p99": percentile(timings, 99),
+            "queries": sum(self.queries) / len(self.queries) if self.queries else 0,
+            "statuses": ",".join(str(s) for s in sorted(self.statuses)),
+        }
+
+
+def measure(name, func, repeat, warmup=1):
+    """Call func repeat times, recording wall time and the queries it ran"""
+    measurement = Measurement(name)
+    for _ in range(warmup):
+        func()
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            start = perf_counter()
+            result = func()
+            elapsed = perf_counter() - start
+        measurement.record(
+            elapsed, len(ctx.captured_queries), getattr(result, "status_code", None)
+        )
+    return measurement
+
+
+def format_table(measurements):
+    header = f"{'endpoint':<24}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}  status"
+    rows = [header, "-" * len(header)]
+    for measurement in measurements:
+        s = measurement.summary()
+        rows.append(
+            f"{s['name']:<24}{s['runs']:>6}{s['p50']:>10.2f}{s['p95']:>10.2f}"
+            f"{s['p99']:>10.2f}{s['queries']:>9.1f}  {s['statuses']}"
+        )
+    return "\n".join(rows)
+
+
+def slow_get(url, headers, send_seconds=0, read_rate=0, timeout=30):
+    """
+    GET url like a client on a slow link: the request is trickled out over
+    send_seconds and the response read at read_rate bytes per second, through
+    a small receive buffer so the server cannot hand it all off at once.
+    Returns the response status.
+    """
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    lines = [f"GET {path} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin1")
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.connect((parts.hostname, parts.port or 80))
+        pieces = 10 if send_seconds else 1
+        size = -(-len(request) // pieces)
+        for offset in range(0, len(request), size):
+            sock.sendall(request[offset : offset + size])
+            if send_seconds:
+                sleep(send_seconds / pieces)
+        head = b""
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            if len(head) < 16:
+                head += data[:16]
+            if read_rate:
+                sleep(len(data) / read_rate)
+    return int(head.split(b" ", 2)[1])
+
+
+def load(name, func, clients, duration):
+    """Call func from `clients` threads for `duration` seconds"""
+    measurement = Measurement(name)
+    measurement.clients = clients
+    measurement.errors = 0
+    lock = threading.Lock()
+    deadline = perf_counter() + duration
+
+    def client():
+        while perf_counter() < deadline:
+            start = perf_counter()
+            try:
+                status = func()
+            except (OSError, ValueError, IndexError):
+                with lock:
+                    measurement.errors += 1
+                continue
+            with lock:
+                measurement.record(perf_counter() - start, 0, status)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    measurement.elapsed = perf_counter() - started
+    return measurement
+
+
+def format_load_table(measurements):
+    header = (
+        f"{'endpoint':<16}{'clients':>8}{'done':>7}{'req/s':>9}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}  status"
+    )
+    rows = [header, "-" * len(header)]
+    for measurement in measurements:
+        s = measurement.summary()
+        rows.append(
+            f"{s['name']:<16}{measurement.clients:>8}{s['runs']:>7}"
+            f"{s['runs'] / measurement.elapsed:>9.1f}{s['p50']:>10.1f}"
+            f"{s['p95']:>10.1f}{s['p99']:>10.1f}{measurement.errors:>8}"
+            f"  {s['statuses']}"
+        )
+    return "\n".join(rows)
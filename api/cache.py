@@ -0,0 +1,77 @@
+"""
+Versioned response caching. Every cached namespace has a version, the time it
+last changed, stored without expiry in a shared cache and for
+LOCAL_CACHE_VERSION_TIMEOUT seconds in a process-local one. Data keys embed
+the version so bumping it on a change orphans all stale entries at once, and
+the same version doubles as the ETag and Last-Modified validator of the
+responses built from it.
+"""
+from datetime import datetime, timezone
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+ITEMS = "items"
+# any customer profile, nested in every order list
+CUSTOMERS = "customers"
+# bumped on order deletion, which no updated_on can reveal
+ORDERS = "orders"
+
+
+LOCAL_BACKENDS = {"django.core.cache.backends.locmem.LocMemCache"}
+
+
+def version_timeout():
+    # a process-local cache misses the bumps made by other workers and commands
+    if settings.CACHES["default"]["BACKEND"] in LOCAL_BACKENDS:
+        return settings.LOCAL_CACHE_VERSION_TIMEOUT
+    return None
+
+
+def version_key(namespace):
+    return f"oms:version:{namespace}"
+
+
+def get_version(namespace):
+    version = cache.get(version_key(namespace))
+    if version is None:
+        # unknown or evicted, start a new version so nothing stale is served
+        cache.add(version_key(namespace), time.time(), version_timeout())
+        version = cache.get(version_key(namespace), time.time())
+    return version
+
+
+def bump_version(*namespaces):
+    now = time.time()
+    cache.set_many(
+        {version_key(namespace): now for namespace in namespaces}, version_timeout()
+    )
+
+
+def data_key(namespace, *parts):
+    digest = hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f"oms:{namespace}:{get_version(namespace)}:{digest}"
+
+
+def etag(namespace, *parts):
+    return hashlib.md5(data_key(namespace, *parts).encode("utf-8")).hexdigest()
+
+
+def last_modified(namespace):
+    return datetime.fromtimestamp(get_version(namespace), tz=timezone.utc)
+
+
+def get_or_build(namespace, parts, build):
+    """Cached value for the namespace and parts, calling build on a miss"""
+    key = data_key(namespace, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, settings.API_CACHE_TIMEOUT)
+    return value
+
+
+def customer_namespace(customer_id):
+    return f"customer:{customer_id}"
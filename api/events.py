@@ -0,0 +1,81 @@
+"""
+In-process publish/subscribe of order changes. Publishers are the sync ORM
+paths of this process, subscribers are the asyncio streams in api.stream, so
+events are handed over to each subscriber's event loop thread-safely. Only
+clients streaming from the same process as the writes see them, changes made
+by other workers and by management commands are not published to anyone,
+which is why gunicorn.conf.py runs a single worker in asgi mode.
+"""
+import asyncio
+import threading
+
+from django.db import transaction
+
+
+class Subscription:
+    def __init__(self, customer_id, max_queued):
+        self.customer_id = customer_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_queued)
+
+    def wants(self, event):
+        return self.customer_id is None or self.customer_id == event["customer_id"]
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a client that cannot keep up misses changes, it can refetch
+            pass
+
+
+class Broker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def has_subscribers(self):
+        return bool(self.subscriptions)
+
+    def subscribe(self, customer_id=None, max_queued=100):
+        """Subscribe the running event loop, customer_id None receives every order"""
+        subscription = Subscription(customer_id, max_queued)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self.lock:
+            subscriptions = [s for s in self.subscriptions if s.wants(event)]
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+
+
+broker = Broker()
+
+
+def order_event(order_id, customer_id, state, total, updated_on):
+    return {
+        "id": order_id,
+        "customer_id": customer_id,
+        "state": state,
+        "total": None if total is None else str(total),
+        "updated_on": updated_on.isoformat() if updated_on else None,
+    }
+
+
+def publish_orders(orders):
+    """Publish the current state of the orders once the transaction commits"""
+    if not broker.has_subscribers():
+        return
+    events = [
+        order_event(*row)
+        for row in orders.values_list(
+            "id", "customer_id", "state", "total", "updated_on"
+        )
+    ]
+    transaction.on_commit(lambda: [broker.publish(event) for event in events])
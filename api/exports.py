@@ -0,0 +1,91 @@
+"""
+Bulk export of orders with their lines. Rows are read from a server-side
+cursor and written out as they arrive, so memory stays flat however many
+orders match.
+"""
+import csv
+from itertools import groupby
+
+from django.conf import settings
+
+from api.models import OrderState, line_total
+from api.renderers import dumps
+
+ORDER_COLUMNS = {
+    "order_id": "id",
+    "customer_id": "customer_id",
+    "username": "customer__user__username",
+    "state": "state",
+    "comment": "comment",
+    "created_on": "created_on",
+    "updated_on": "updated_on",
+    "total": "total",
+}
+LINE_COLUMNS = {
+    "line_id": "orderitem__id",
+    "item": "orderitem__item__name",
+    "quantity": "orderitem__quantity",
+    "unit": "orderitem__unit",
+    "price": "orderitem__price",
+}
+
+
+def export_rows(queryset):
+    """One row per order line, orders without lines give a single row of blanks"""
+    columns = [*ORDER_COLUMNS.values(), *LINE_COLUMNS.values()]
+    return (
+        queryset.order_by("created_on", "id", "orderitem__id")
+        .values_list(*columns)
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+def split_row(row):
+    order = dict(zip(ORDER_COLUMNS, row[: len(ORDER_COLUMNS)]))
+    order["state"] = OrderState.values.get(order["state"], order["state"])
+    line = dict(zip(LINE_COLUMNS, row[len(ORDER_COLUMNS) :]))
+    if line["line_id"] is None:
+        return order, None
+    line["total"] = line_total(line["price"], line["quantity"])
+    return order, line
+
+
+# spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def format_value(value):
+    """A CSV cell, free text that would be read as a formula is quoted with '"""
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([*ORDER_COLUMNS, *LINE_COLUMNS, "line_total"])
+    for row in rows:
+        order, line = split_row(row)
+        values = list(order.values())
+        values.extend(line.values() if line else [None] * (len(LINE_COLUMNS) + 1))
+        yield writer.writerow([format_value(v) for v in values])
+
+
+def jsonl_lines(rows):
+    """One JSON document per order with its lines nested"""
+    for _, group in groupby(rows, key=lambda row: row[0]):
+        order, line = split_row(next(group))
+        order["lines"] = [line] if line else []
+        order["lines"].extend(split_row(row)[1] for row in group)
+        yield dumps(order) + b"\n"
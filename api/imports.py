@@ -0,0 +1,240 @@
+"""
+Bulk import of the item catalog and of orders from CSV or JSON Lines. Records
+are validated and written a batch at a time, a record that fails validation is
+reported with its row number and skipped, the rest of its batch still loads.
+
+Items are upserted by case insensitive name. Orders are always created, in
+CSV their lines are consecutive rows sharing an `order_ref`.
+"""
+import codecs
+import csv
+
+import orjson
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from api import reports
+from api.cache import ITEMS, ORDERS, bump_version
+from api.events import publish_orders
+from api.models import (
+    Customer,
+    Item,
+    ItemPrice,
+    Order,
+    OrderItem,
+    line_total,
+    normalize_item_name,
+)
+from api.serializers import ItemImportSerializer, OrderImportSerializer
+from api.streaming import chunked
+
+ORDER_FIELDS = ("customer", "username", "state", "comment")
+LINE_FIELDS = ("item", "quantity", "unit", "price")
+
+
+class ImportResult:
+    def __init__(self, max_errors=None):
+        self.max_errors = max_errors or settings.IMPORT_MAX_ERRORS
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "errors": errors})
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+def read_csv(lines):
+    """(row number, record, error) for each data row of a CSV header and body"""
+    reader = csv.DictReader(codecs.iterdecode(lines, "utf-8-sig"))
+    for record in reader:
+        # CSV cannot tell an empty value from a missing one, treat both as missing
+        record = {k: v for k, v in record.items() if k and v not in ("", None)}
+        yield reader.line_num, record, None
+
+
+def read_jsonl(lines):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as exc:
+            yield number, None, {"non_field_errors": [f"Invalid JSON: {exc}"]}
+            continue
+        if not isinstance(record, dict):
+            yield number, None, {"non_field_errors": ["Expected a JSON object"]}
+            continue
+        yield number, record, None
+
+
+def group_order_rows(records):
+    """Fold consecutive CSV rows with the same order_ref into one order record"""
+    current = None
+    for row, record, error in records:
+        if error:
+            yield row, record, error
+            continue
+        ref = record.get("order_ref")
+        if current is not None and ref is not None and ref == current[1]["ref"]:
+            current[1]["lines"].append(line_of(record))
+            continue
+        if current is not None:
+            yield current
+        order = {k: record[k] for k in ORDER_FIELDS if k in record}
+        order["ref"] = ref
+        order["lines"] = [line_of(record)]
+        current = (row, order, None)
+    if current is not None:
+        yield current
+
+
+def line_of(record):
+    return {k: record[k] for k in LINE_FIELDS if k in record}
+
+
+def read_records(lines, file_format, kind):
+    if file_format == "csv":
+        records = read_csv(lines)
+        return group_order_rows(records) if kind == "orders" else records
+    if file_format == "jsonl":
+        return read_jsonl(lines)
+    raise ValueError(f"Unknown format {file_format}, expected csv or jsonl")
+
+
+def validated(batch, serializer_class, result):
+    # one instance for every record, building the fields dominates otherwise
+    serializer = serializer_class()
+    for row, record, error in batch:
+        if error:
+            result.error(row, error)
+            continue
+        try:
+            data = serializer.run_validation(record)
+        except ValidationError as exc:
+            result.error(row, exc.detail)
+            continue
+        yield row, data
+
+
+def import_items(records, batch_size, result):
+    for batch in chunked(records, batch_size):
+        prices = {}
+        for _, data in validated(batch, ItemImportSerializer, result):
+            # a later row for the same name wins
+            prices[normalize_item_name(data["name"])] = data.get("default_price")
+        with transaction.atomic():
+            existing = Item.objects.by_names(prices)
+            changed = []
+            for name, item in existing.items():
+                if prices[name] is not None and item.default_price != prices[name]:
+                    item.default_price = prices[name]
+                    changed.append(item)
+            Item.objects.bulk_update(changed, ["default_price"])
+            new = [
+                Item(name=name, default_price=prices[name] or 0)
+                for name in prices.keys() - existing.keys()
+            ]
+            # no update_conflicts before django 4.1, rows raced in are left as is
+            Item.objects.bulk_create(new, ignore_conflicts=True)
+            # ignore_conflicts leaves pks unset, read the new items back
+            ItemPrice.objects.record(
+                changed + list(Item.objects.filter_names([i.name for i in new]))
+            )
+        result.created += len(new)
+        result.updated += len(changed)
+    bump_version(ITEMS)
+    return result
+
+
+def resolve_customers(orders):
+    ids = {data["customer"] for _, data in orders if "customer" in data}
+    usernames = {data["username"] for _, data in orders if "username" in data}
+    known_ids = set(Customer.objects.filter(id__in=ids).values_list("id", flat=True))
+    by_username = dict(
+        Customer.objects.filter(user__username__in=usernames).values_list(
+            "user__username", "id"
+        )
+    )
+    for row, data in orders:
+        if "customer" in data:
+            customer_id = data["customer"] if data["customer"] in known_ids else None
+        else:
+            customer_id = by_username.get(data["username"])
+        yield row, data, customer_id
+
+
+def import_orders(records, batch_size, result):
+    for batch in chunked(records, batch_size):
+        orders = []
+        for row, data, customer_id in resolve_customers(
+            list(validated(batch, OrderImportSerializer, result))
+        ):
+            if customer_id is None:
+                result.error(row, {"customer": ["Unknown customer"]})
+                continue
+            orders.append((data, customer_id))
+        if not orders:
+            continue
+
+        items = Item.objects.get_or_create_many(
+            line["item"] for data, _ in orders for line in data["lines"]
+        )
+        prices = Item.objects.prices_as_of([item.pk for item in items.values()])
+        for data, _ in orders:
+            for line in data["lines"]:
+                line["item"] = items[normalize_item_name(line["item"])]
+                if line.get("price") is None:
+                    line["price"] = prices[line["item"].pk]
+        with transaction.atomic():
+            created = Order.objects.bulk_create(
+                Order(
+                    customer_id=customer_id,
+                    state=data["state"],
+                    comment=data.get("comment"),
+                    total=sum(
+                        line_total(line["price"], line["quantity"])
+                        for line in data["lines"]
+                    ),
+                )
+                for data, customer_id in orders
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(
+                    order=order,
+                    item=line["item"],
+                    quantity=line["quantity"],
+                    unit=line["unit"],
+                    price=line["price"],
+                )
+                for order, (data, _) in zip(created, orders)
+                for line in data["lines"]
+            )
+            created_orders = Order.objects.filter(pk__in=[o.pk for o in created])
+            publish_orders(created_orders)
+            # bulk_create sends no post_save, delivered orders join the rollups here
+            reports.refresh_delivered(created_orders)
+        result.created += len(created)
+    bump_version(ORDERS)
+    return result
+
+
+IMPORTERS = {"items": import_items, "orders": import_orders}
+
+
+def import_file(lines, file_format, kind, batch_size=None, result=None):
+    """Import an iterable of byte lines, kind is `items` or `orders`"""
+    result = result or ImportResult()
+    records = read_records(lines, file_format, kind)
+    return IMPORTERS[kind](records, batch_size or settings.IMPORT_BATCH_SIZE, result)
@@ -0,0 +1,112 @@
+from functools import partial
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import format_load_table, load, slow_get
+from api.models import Order, User
+from api.roles import ADMIN
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a running server with many slow clients and report throughput and "
+        "latency per endpoint and client count. Run it against the same database "
+        "with the server started as SERVER_MODE=wsgi and then SERVER_MODE=asgi "
+        "(see gunicorn.conf.py) to compare how many slow clients each mode serves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Base URL of the server, e.g. http://localhost")
+        parser.add_argument(
+            "--clients",
+            type=int,
+            nargs="+",
+            default=[10, 50, 200],
+            help="Concurrent clients, one run per value",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds per run"
+        )
+        parser.add_argument(
+            "--send-seconds",
+            type=float,
+            default=0.5,
+            help="Seconds each client takes to send its request",
+        )
+        parser.add_argument(
+            "--read-rate",
+            type=int,
+            default=16384,
+            help="Bytes per second each client reads, 0 reads as fast as it can",
+        )
+        parser.add_argument("--limit", type=int, default=50, help="List page size")
+        parser.add_argument(
+            "--endpoints",
+            nargs="*",
+            default=["order-all", "order-detail", "item-list"],
+            help="Endpoints to load: order-list, order-all, order-detail, item-list",
+        )
+        parser.add_argument(
+            "--username",
+            help="Admin user to run as, defaults to the first member of the admin group",
+        )
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        user = self.get_user(options["username"])
+        token, _ = Token.objects.get_or_create(user=user)
+        order_ids = list(
+            Order.objects.order_by("-id").values_list("id", flat=True)[:1000]
+        )
+        if not order_ids:
+            raise CommandError("No orders to benchmark, run `seeddata` first")
+
+        base = options["url"].rstrip("/")
+        limit = options["limit"]
+        paths = {
+            "order-list": lambda: f"{reverse('order-list')}?limit={limit}",
+            "order-all": lambda: f"{reverse('order-all')}?limit={limit}",
+            "order-detail": lambda: reverse(
+                "order-detail", args=(rng.choice(order_ids),)
+            ),
+            "item-list": lambda: f"{reverse('item-list')}?limit={limit}",
+        }
+        unknown = set(options["endpoints"]) - paths.keys()
+        if unknown:
+            raise CommandError(f"Unknown endpoints {sorted(unknown)}")
+
+        get = partial(
+            slow_get,
+            headers={"Authorization": f"Token {token.key}"},
+            send_seconds=options["send_seconds"],
+            read_rate=options["read_rate"],
+            timeout=options["timeout"],
+        )
+        measurements = []
+        for name in options["endpoints"]:
+            for clients in options["clients"]:
+                measurements.append(
+                    load(
+                        name,
+                        lambda: get(base + paths[name]()),
+                        clients,
+                        options["duration"],
+                    )
+                )
+        self.stdout.write(format_load_table(measurements))
+
+    def get_user(self, username):
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        else:
+            users = users.filter(groups__name=ADMIN, customer__isnull=False)
+        user = users.first()
+        if user is None:
+            raise CommandError("No admin user with a customer profile to run as")
+        return user
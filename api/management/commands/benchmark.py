@@ -0,0 +1,118 @@
+import logging
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from api.benchmarks import format_table, measure
+from api.models import Order, OrderItem, User
+from api.roles import ADMIN
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency percentiles and query counts of the main API endpoints "
+        "against the configured database, seed it first with `seeddata`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--limit", type=int, default=50, help="List page size")
+        parser.add_argument(
+            "--username",
+            help="Admin user to run as, defaults to the first member of the admin group",
+        )
+        parser.add_argument(
+            "--host", default="localhost", help="Host header, must be in ALLOWED_HOSTS"
+        )
+        parser.add_argument(
+            "--endpoints",
+            nargs="*",
+            help="Only run these endpoints, e.g. order-list order-detail",
+        )
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        user = self.get_user(options["username"])
+        client = Client(HTTP_HOST=options["host"])
+        client.force_login(user)
+
+        order_ids = list(
+            Order.objects.order_by("-id").values_list("id", flat=True)[:1000]
+        )
+        line_ids = list(
+            OrderItem.objects.filter(order_id__in=order_ids[:100]).values_list(
+                "id", flat=True
+            )
+        )
+        if not order_ids or not line_ids:
+            raise CommandError("No orders to benchmark, run `seeddata` first")
+
+        limit = options["limit"]
+        middle = Order.objects.count() // 2
+        endpoints = {
+            "order-list": lambda: client.get(reverse("order-list"), {"limit": limit}),
+            "order-list-cursor": lambda: client.get(
+                reverse("order-list"), {"limit": limit, "cursor": ""}
+            ),
+            "order-all": lambda: client.get(reverse("order-all"), {"limit": limit}),
+            "order-all-lean": lambda: client.get(
+                reverse("order-all"),
+                {"limit": limit, "fields": "id,state,total,created_on,customer"},
+            ),
+            "order-all-expanded": lambda: client.get(
+                reverse("order-all"), {"limit": limit, "expand": "customer"}
+            ),
+            "order-all-deep": lambda: client.get(
+                reverse("order-all"),
+                {"limit": limit, "offset": middle},
+            ),
+            "order-detail": lambda: client.get(
+                reverse("order-detail", args=(self.random.choice(order_ids),))
+            ),
+            "add_item": lambda: client.post(
+                reverse("order-add-item", args=(self.random.choice(order_ids),)),
+                {"name": "benchmark item", "quantity": 1, "unit": "kg"},
+                content_type="application/json",
+            ),
+            "orderitem-update": lambda: client.patch(
+                reverse("orderitem-detail", args=(self.random.choice(line_ids),)),
+                {"price": f"{self.random.randint(100, 10000) / 100:.2f}"},
+                content_type="application/json",
+            ),
+            "receipt": lambda: client.get(
+                reverse("order-receipt", args=(self.random.choice(order_ids),))
+            ),
+        }
+        selected = options["endpoints"] or list(endpoints)
+        unknown = set(selected) - endpoints.keys()
+        if unknown:
+            raise CommandError(f"Unknown endpoints {sorted(unknown)}")
+
+        disabled = logging.root.manager.disable
+        logging.disable(logging.INFO)
+        try:
+            # add_item, orderitem-update and receipt write, keep none of it
+            with transaction.atomic():
+                measurements = [
+                    measure(name, endpoints[name], options["repeat"])
+                    for name in selected
+                ]
+                transaction.set_rollback(True)
+        finally:
+            logging.disable(disabled)
+        self.stdout.write(format_table(measurements))
+
+    def get_user(self, username):
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        else:
+            users = users.filter(groups__name=ADMIN, customer__isnull=False)
+        user = users.first()
+        if user is None:
+            raise CommandError("No admin user with a customer profile to run as")
+        return user
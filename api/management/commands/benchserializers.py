@@ -0,0 +1,62 @@
+from io import BytesIO
+from itertools import cycle
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.benchmarks import format_table, measure
+from api.models import Customer, Item, Order, OrderItem, OrderState
+from api.renderers import ORJSONParser, ORJSONRenderer
+from api.serializers import OrderDetailSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure serializing, rendering and parsing an order with many lines, "
+        "the order is created in a transaction that is rolled back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--lines", type=int, default=100)
+
+    def handle(self, *args, **options):
+        customer = Customer.objects.first()
+        items = list(Item.objects.all()[: options["lines"]])
+        if customer is None or not items:
+            raise CommandError("Needs a customer and items, run `seeddata` first")
+
+        with transaction.atomic():
+            order = self.create_order(customer, items, options["lines"])
+            measurements = self.run(order, options["repeat"])
+            transaction.set_rollback(True)
+        self.stdout.write(format_table(measurements))
+
+    def create_order(self, customer, items, lines):
+        order = Order.objects.create(customer=customer, state=OrderState.CREATED)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, item=item, quantity=i + 1, price="12.34", unit="kg")
+            for i, item in zip(range(lines), cycle(items))
+        )
+        return (
+            Order.objects.select_related("customer__user")
+            .prefetch_related(
+                Prefetch("orderitem_set", OrderItem.objects.select_related("item"))
+            )
+            .get(pk=order.pk)
+        )
+
+    def run(self, order, repeat):
+        data = OrderDetailSerializer(order).data
+        body = JSONRenderer().render(data)
+        cases = {
+            "serialize": lambda: OrderDetailSerializer(order).data,
+            "render-stdlib": lambda: JSONRenderer().render(data),
+            "render-orjson": lambda: ORJSONRenderer().render(data),
+            "parse-stdlib": lambda: JSONParser().parse(BytesIO(body)),
+            "parse-orjson": lambda: ORJSONParser().parse(BytesIO(body)),
+        }
+        return [measure(name, func, repeat) for name, func in cases.items()]
@@ -0,0 +1,68 @@
+from decimal import Decimal
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Order, OrderItem, line_total
+
+
+def expected_totals(chunk_size):
+    """Yield (order_id, total) computed from the lines, one order at a time"""
+    lines = (
+        OrderItem.objects.order_by("order_id")
+        .values_list("order_id", "price", "quantity")
+        .iterator(chunk_size=chunk_size)
+    )
+    order_id, total = None, Decimal("0.00")
+    for line_order_id, price, quantity in lines:
+        if line_order_id != order_id:
+            if order_id is not None:
+                yield order_id, total
+            order_id, total = line_order_id, Decimal("0.00")
+        total += line_total(price, quantity)
+    if order_id is not None:
+        yield order_id, total
+
+
+class Command(BaseCommand):
+    help = "Verify Order.total against the order lines and optionally repair it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Write the recomputed total for every mismatched order",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        # merge join of orders and line sums, both walked in order id order
+        expected = expected_totals(chunk_size)
+        next_expected = next(expected, None)
+        mismatched = []
+        now = timezone.now()
+        orders = (
+            Order.objects.order_by("id")
+            .values_list("id", "total")
+            .iterator(chunk_size=chunk_size)
+        )
+        for order_id, total in orders:
+            computed = Decimal("0.00")
+            while next_expected and next_expected[0] <= order_id:
+                if next_expected[0] == order_id:
+                    computed = next_expected[1]
+                next_expected = next(expected, None)
+            if (total or Decimal("0.00")) != computed:
+                mismatched.append(Order(id=order_id, total=computed, updated_on=now))
+                logging.info(f"Order #{order_id}: stored {total}, lines sum {computed}")
+
+        if mismatched and options["fix"]:
+            with transaction.atomic():
+                Order.objects.bulk_update(
+                    mismatched, ["total", "updated_on"], batch_size=chunk_size
+                )
+        action = "Fixed" if options["fix"] else "Found"
+        self.stdout.write(f"{action} {len(mismatched)} orders with a drifted total")
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Customer, Item, Order, OrderItem, OrderState
+
+
+def query_patterns():
+    """The queries the API runs most, keyed by a short name"""
+    order = Order.objects.order_by("-id").first()
+    customer_id = order.customer_id if order else 0
+    order_id = order.id if order else 0
+    user_id = (
+        Customer.objects.filter(id=customer_id)
+        .values_list("user_id", flat=True)
+        .first()
+    )
+    return {
+        "customer orders page": Order.objects.filter(customer_id=customer_id).order_by(
+            "-created_on", "-id"
+        )[:10],
+        "all orders page": Order.objects.order_by("-created_on", "-id")[:10],
+        "open orders page": Order.objects.filter(
+            state__in=[OrderState.CREATED, OrderState.PROCESSING]
+        ).order_by("-created_on")[:10],
+        "created orders page": Order.objects.filter(state=OrderState.CREATED).order_by(
+            "-created_on"
+        )[:10],
+        "item by name": Item.objects.filter_names(["rice"]),
+        "customer by user": Customer.objects.filter(user_id=user_id),
+        "order lines": OrderItem.objects.filter(order_id=order_id),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plan of the main API queries. Seed a database, then run it "
+        "before and after `migrate` to compare the plans"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Run the queries and report actual timings (PostgreSQL only)",
+        )
+
+    def handle(self, *args, **options):
+        explain_options = {"analyze": True} if options["analyze"] else {}
+        for name, queryset in query_patterns().items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write("")
@@ -0,0 +1,56 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import IMPORTERS, ImportResult, import_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Import items (name, default_price) or orders with their lines from a "
+        "CSV or JSON Lines file, rows that fail validation are reported and skipped"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS))
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Defaults to the extension of the file",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.IMPORT_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--max-errors",
+            type=int,
+            default=settings.IMPORT_MAX_ERRORS,
+            help="Errors listed in the report, all of them are counted",
+        )
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or os.path.splitext(options["path"])[1][1:]
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Pass --format, the extension is not csv or jsonl")
+        result = ImportResult(options["max_errors"])
+        try:
+            with open(options["path"], "rb") as lines:
+                import_file(
+                    lines,
+                    file_format,
+                    options["kind"],
+                    options["batch_size"],
+                    result,
+                )
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in result.errors:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            f"Created {result.created}, updated {result.updated}, "
+            f"failed {result.failed} {options['kind']}"
+        )
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.receipts import pending_receipts, render_receipt, requeue_stale
+
+
+def render_in_thread(receipt_id):
+    try:
+        return render_receipt(receipt_id)
+    finally:
+        # every pool thread holds its own connection
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Render queued order receipts to PDF"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Number of receipts rendered in parallel",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling the queue instead of exiting once it is drained",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep between polls when the queue is empty",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=300,
+            help="Seconds after which a receipt stuck in rendering is requeued",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        stale_after = timedelta(seconds=options["stale_after"])
+        pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            while True:
+                requeued = requeue_stale(stale_after)
+                if requeued:
+                    logging.info(f"Requeued {requeued} stale receipts")
+                batch = pending_receipts(limit=workers * 4)
+                if batch:
+                    if pool:
+                        rendered = sum(pool.map(render_in_thread, batch))
+                    else:
+                        rendered = sum(map(render_receipt, batch))
+                    logging.info(f"Rendered {rendered} of {len(batch)} receipts")
+                    continue
+                if not options["watch"]:
+                    break
+                time.sleep(options["interval"])
+        finally:
+            if pool:
+                pool.shutdown()
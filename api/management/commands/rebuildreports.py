@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api import reports
+from api.models import DailyCustomerSales, DailyItemSales
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from the delivered orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since", help="Only rebuild days from this date (YYYY-MM-DD) on"
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_date(options["since"])
+            if since is None:
+                raise CommandError(f"Invalid date {options['since']}")
+        reports.rebuild(since, options["chunk_size"])
+        self.stdout.write(
+            f"Rollups hold {DailyCustomerSales.objects.count()} customer days "
+            f"and {DailyItemSales.objects.count()} item days"
+        )
@@ -0,0 +1,75 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api.models import Item, Order, OrderItem, OrderState, line_total
+
+
+class Command(BaseCommand):
+    help = (
+        "Price the lines of open orders from the item price history, by default "
+        "only lines without a price"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--as-of", help="Use prices effective on this date (YYYY-MM-DD), today"
+        )
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Also replace prices already set on the lines",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        day = timezone.localdate()
+        if options["as_of"]:
+            day = parse_date(options["as_of"])
+            if day is None:
+                raise CommandError(f"Invalid date {options['as_of']}")
+
+        lines = OrderItem.objects.filter(
+            order__state__in=[OrderState.CREATED, OrderState.PROCESSING]
+        ).only("id", "order_id", "item_id", "quantity", "price")
+        if not options["overwrite"]:
+            lines = lines.filter(price__isnull=True)
+
+        repriced, orders, last_id = 0, set(), 0
+        while True:
+            # keyset chunks, the rows are written while walking the table
+            chunk = list(
+                lines.filter(id__gt=last_id).order_by("id")[: options["chunk_size"]]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            changed, deltas = self.reprice(chunk, day)
+            repriced += len(changed)
+            orders.update(deltas)
+            if changed and not options["dry_run"]:
+                with transaction.atomic():
+                    OrderItem.objects.bulk_update(changed, ["price"])
+                    for order_id, delta in deltas.items():
+                        Order.objects.filter(pk=order_id).lines_changed(delta)
+
+        verb = "Would reprice" if options["dry_run"] else "Repriced"
+        self.stdout.write(
+            f"{verb} {repriced} lines of {len(orders)} orders as of {day}"
+        )
+
+    def reprice(self, lines, day):
+        prices = Item.objects.prices_as_of({line.item_id for line in lines}, day)
+        changed, deltas = [], defaultdict(int)
+        for line in lines:
+            price = prices.get(line.item_id)
+            if price is None or price == line.price:
+                continue
+            deltas[line.order_id] += line_total(price, line.quantity) - line.total
+            line.price = price
+            changed.append(line)
+        return changed, deltas
@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+import logging
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Customer, Item, Order, OrderItem, OrderState, User
+
+UNITS = ["number", "dozen", "g", "kg", "lts", "m", "cm"]
+STATES = [
+    OrderState.CREATED,
+    OrderState.PROCESSING,
+    OrderState.DELIVERED,
+    OrderState.DELIVERED,
+    OrderState.DELIVERED,
+    OrderState.CANCELLED,
+]
+
+
+@contextmanager
+def explicit_created_on():
+    """Let bulk_create keep the created_on we spread over the past instead of now"""
+    field = Order._meta.get_field("created_on")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def batched(count, size):
+    for start in range(0, count, size):
+        yield start, min(size, count - start)
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic customers, items, orders and lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=100)
+        parser.add_argument("--items", type=int, default=500)
+        parser.add_argument("--orders", type=int, default=10000)
+        parser.add_argument(
+            "--lines", type=int, default=20, help="Maximum lines per order"
+        )
+        parser.add_argument(
+            "--days", type=int, default=365, help="Spread orders over this many days"
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--password", default="admin")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        prefix = timezone.now().strftime("%y%m%d%H%M%S")
+        customer_ids = self.seed_customers(
+            options["customers"], make_password(options["password"]), prefix
+        )
+        items = self.seed_items(options["items"], prefix)
+        with explicit_created_on():
+            orders, lines = self.seed_orders(
+                options["orders"],
+                options["lines"],
+                options["days"],
+                customer_ids,
+                items,
+            )
+        self.stdout.write(
+            f"Seeded {len(customer_ids)} customers, {len(items)} items, "
+            f"{orders} orders and {lines} order lines"
+        )
+
+    def seed_customers(self, count, password, prefix):
+        customer_ids = []
+        for start, size in batched(count, self.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    [
+                        User(username=f"seed{prefix}{start + i}", password=password)
+                        for i in range(size)
+                    ]
+                )
+                customers = Customer.objects.bulk_create(
+                    [
+                        Customer(
+                            user=user,
+                            ship=f"Ship {user.username}",
+                            supervisor=f"Supervisor {start + i}",
+                            contact=user.username,
+                        )
+                        for i, user in enumerate(users)
+                    ]
+                )
+            customer_ids.extend(customer.id for customer in customers)
+            logging.info(f"Seeded {len(customer_ids)} customers")
+        return customer_ids
+
+    def seed_items(self, count, prefix):
+        items = []
+        for start, size in batched(count, self.batch_size):
+            items.extend(
+                Item.objects.bulk_create(
+                    [
+                        Item(
+                            name=f"item {prefix} {start + i}",
+                            default_price=Decimal(self.random.randint(100, 50000))
+                            / 100,
+                        )
+                        for i in range(size)
+                    ]
+                )
+            )
+        return items
+
+    def seed_orders(self, count, max_lines, days, customer_ids, items):
+        now = timezone.now()
+        seeded_lines = 0
+        for start, size in batched(count, self.batch_size):
+            orders, lines = [], []
+            for _ in range(size):
+                order = Order(
+                    customer_id=self.random.choice(customer_ids),
+                    state=self.random.choice(STATES),
+                    created_on=now
+                    - timedelta(seconds=self.random.randint(0, days * 86400)),
+                )
+                order_lines = [
+                    OrderItem(
+                        item=item,
+                        quantity=self.random.randint(1, 50),
+                        unit=self.random.choice(UNITS),
+                        price=item.default_price,
+                    )
+                    for item in self.random.sample(
+                        items, self.random.randint(1, min(max_lines, len(items)))
+                    )
+                ]
+                order.total = sum(line.total for line in order_lines)
+                orders.append(order)
+                lines.append(order_lines)
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                for order, order_lines in zip(orders, lines):
+                    for line in order_lines:
+                        line.order = order
+                flat = [line for order_lines in lines for line in order_lines]
+                OrderItem.objects.bulk_create(flat, batch_size=self.batch_size)
+            seeded_lines += len(flat)
+            logging.info(f"Seeded {start + size} orders")
+        return count, seeded_lines
@@ -0,0 +1,40 @@
+# Generated by Django 4.0.4 on 2026-10-18 01:22
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def merge_duplicate_items(apps, schema_editor):
+    """Point order lines at the oldest of items whose names differ only in case"""
+    Item = apps.get_model("api", "Item")
+    OrderItem = apps.get_model("api", "OrderItem")
+    keep = {}
+    for item in Item.objects.order_by("id"):
+        name = item.name.strip().lower()
+        if name not in keep:
+            keep[name] = item.id
+            continue
+        OrderItem.objects.filter(item_id=item.id).update(item_id=keep[name])
+        item.delete()
+
+
+class Migration(migrations.Migration):
+    # on PostgreSQL the index can't be built in the transaction that rewrote
+    # order_item rows, the merge commits on its own first
+    atomic = False
+
+    dependencies = [
+        ("api", "0002_receipt"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_items, migrations.RunPython.noop, atomic=True
+        ),
+        migrations.AddConstraint(
+            model_name="item",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("name"), name="unique_item_name"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-18 01:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_order_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("state__in", ["C", "P"])),
+                fields=["state", "created_on"],
+                name="order_open_state",
+            ),
+        ),
+    ]
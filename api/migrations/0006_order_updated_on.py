@@ -0,0 +1,34 @@
+# Generated by Django 4.0.4 on 2026-10-18 01:34
+
+from django.db import migrations, models
+
+
+def backfill_updated_on(apps, schema_editor):
+    Order = apps.get_model("api", "Order")
+    Order.objects.update(updated_on=models.F("created_on"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_order_open_state_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="updated_on",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_on, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["customer", "updated_on"], name="order_customer_updated"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["updated_on"], name="order_updated"),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 4.0.4 on 2026-10-18 01:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_order_updated_on"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyItemSales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("unit", models.CharField(max_length=10)),
+                ("quantity", models.FloatField(default=0)),
+                ("lines", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=30),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="api.customer"
+                    ),
+                ),
+                (
+                    "item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="api.item"
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailyCustomerSales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("orders", models.PositiveIntegerField(default=0)),
+                ("lines", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=30),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="api.customer"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="dailyitemsales",
+            index=models.Index(fields=["item", "day"], name="item_sales_day"),
+        ),
+        migrations.AddIndex(
+            model_name="dailyitemsales",
+            index=models.Index(
+                fields=["customer", "item", "day"], name="customer_item_sales_day"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyitemsales",
+            constraint=models.UniqueConstraint(
+                fields=("day", "customer", "item", "unit"), name="unique_item_sales_day"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dailycustomersales",
+            index=models.Index(fields=["customer", "day"], name="customer_sales_day"),
+        ),
+        migrations.AddConstraint(
+            model_name="dailycustomersales",
+            constraint=models.UniqueConstraint(
+                fields=("day", "customer"), name="unique_customer_sales_day"
+            ),
+        ),
+    ]
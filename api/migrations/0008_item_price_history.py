@@ -0,0 +1,62 @@
+# Generated by Django 4.0.4 on 2026-10-18 01:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def record_default_prices(apps, schema_editor):
+    Item = apps.get_model("api", "Item")
+    ItemPrice = apps.get_model("api", "ItemPrice")
+    today = django.utils.timezone.localdate()
+    ItemPrice.objects.bulk_create(
+        ItemPrice(item_id=pk, price=price, effective_on=today)
+        for pk, price in Item.objects.filter(default_price__gt=0).values_list(
+            "pk", "default_price"
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_sales_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ItemPrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("price", models.DecimalField(decimal_places=2, max_digits=30)),
+                (
+                    "effective_on",
+                    models.DateField(default=django.utils.timezone.localdate),
+                ),
+                ("created_on", models.DateTimeField(auto_now_add=True)),
+                (
+                    "item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="prices",
+                        to="api.item",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="itemprice",
+            constraint=models.UniqueConstraint(
+                fields=("item", "effective_on"), name="unique_item_price_day"
+            ),
+        ),
+        migrations.RunPython(record_default_prices, migrations.RunPython.noop),
+    ]
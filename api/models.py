@@ -1,5 +1,14 @@
-from django.db import models
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Cast, Coalesce, Lower, Round
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
+from django.dispatch import Signal
+
+from api.cache import ITEMS, bump_version
+from api.events import publish_orders
 
 
 class OrderState:
@@ -15,6 +24,19 @@ class OrderState:
     }
 
 
+class ReceiptState:
+    PENDING = "P"
+    RENDERING = "R"
+    READY = "D"
+    FAILED = "F"
+    values = {
+        PENDING: "Pending",
+        RENDERING: "Rendering",
+        READY: "Ready",
+        FAILED: "Failed",
+    }
+
+
 class User(AbstractUser):
     pass
 
@@ -29,6 +51,57 @@ class Customer(models.Model):
         return self.user.username
 
 
+CENT = Decimal("0.01")
+
+
+def line_total(price, quantity):
+    """Amount of an order line rounded to cents, unpriced lines count as zero"""
+    if price is None or quantity is None:
+        return Decimal("0.00")
+    # half up like SQL ROUND, so it agrees with line_total_expression
+    return (Decimal(price) * Decimal(str(quantity))).quantize(CENT, ROUND_HALF_UP)
+
+
+def line_total_expression():
+    """line_total computed by the database, for annotating OrderItem querysets"""
+    amount = F("price") * Cast(
+        "quantity", models.DecimalField(max_digits=30, decimal_places=4)
+    )
+    return Coalesce(
+        Round(
+            amount, 2, output_field=models.DecimalField(max_digits=30, decimal_places=2)
+        ),
+        Decimal("0.00"),
+    )
+
+
+# sent with `orders`, a queryset of the orders whose lines were changed
+order_lines_changed = Signal()
+
+
+class OrderQuerySet(models.QuerySet):
+    def lines_changed(self, total_delta=0):
+        """Mark matched orders as updated and add total_delta to their total"""
+        changes = {"updated_on": timezone.now()}
+        if total_delta:
+            changes["total"] = Coalesce(F("total"), Decimal("0.00")) + total_delta
+        updated = self.update(**changes)
+        publish_orders(self)
+        order_lines_changed.send(sender=self.model, orders=self)
+        return updated
+
+    def with_lines(self):
+        """Load customer, lines and their items in two queries, whatever the size"""
+        lines = (
+            OrderItem.objects.select_related("item")
+            .annotate(amount=line_total_expression())
+            .order_by("id")
+        )
+        return self.select_related("customer__user").prefetch_related(
+            models.Prefetch("orderitem_set", queryset=lines)
+        )
+
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     state = models.CharField(
@@ -42,20 +115,165 @@ class Order(models.Model):
     )
     comment = models.TextField(null=True, blank=True)
     created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
     total = models.DecimalField(max_digits=30, decimal_places=2, blank=True, null=True)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pages of a customer's orders and of all orders
+            models.Index(
+                fields=["customer", "created_on", "id"], name="order_customer_created"
+            ),
+            models.Index(fields=["created_on", "id"], name="order_created"),
+            # dashboard of orders still being worked on, a small slice of the table
+            models.Index(
+                fields=["state", "created_on"],
+                name="order_open_state",
+                condition=models.Q(
+                    state__in=[OrderState.CREATED, OrderState.PROCESSING]
+                ),
+            ),
+            # validators for conditional GETs of order lists
+            models.Index(
+                fields=["customer", "updated_on"], name="order_customer_updated"
+            ),
+            models.Index(fields=["updated_on"], name="order_updated"),
+        ]
+
     def __str__(self):
         return f"Order #{self.id}"
 
 
+def normalize_item_name(name):
+    return name.strip().lower()
+
+
+class ItemManager(models.Manager):
+    def filter_names(self, names):
+        return self.annotate(normalized_name=Lower("name")).filter(
+            normalized_name__in=names
+        )
+
+    def by_names(self, names):
+        """Map normalized name to Item for the given names, in a single query"""
+        return {item.normalized_name: item for item in self.filter_names(names)}
+
+    def prices_as_of(self, item_ids, day=None):
+        """
+        Map item id to its price on `day` (today by default): the latest ItemPrice
+        effective by then, else default_price. A price of 0 means unpriced, None.
+        """
+        prices = ItemPrice.objects.history_as_of(item_ids, day, with_default=True)
+        return {pk: price or None for pk, price in prices.items()}
+
+    def get_or_create_many(self, names):
+        """Resolve names to Items, inserting all the missing ones at once"""
+        names = {normalize_item_name(name) for name in names}
+        items = self.by_names(names)
+        missing = names - items.keys()
+        if missing:
+            # rows raced in by a concurrent order are skipped and re-read below
+            self.bulk_create(
+                [self.model(name=name) for name in missing], ignore_conflicts=True
+            )
+            items.update(self.by_names(missing))
+            # bulk_create sends no post_save, tell the item cache directly
+            bump_version(ITEMS)
+        return items
+
+
 class Item(models.Model):
     name = models.CharField(max_length=100)
     default_price = models.DecimalField(max_digits=30, decimal_places=2, default=0.00)
 
+    objects = ItemManager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(Lower("name"), name="unique_item_name")]
+
     def __str__(self):
         return self.name
 
 
+class ItemPriceManager(models.Manager):
+    def history_as_of(self, item_ids, day=None, with_default=False):
+        """Map item id to its latest recorded price effective on `day`, one query"""
+        latest = (
+            self.filter(
+                item=models.OuterRef("pk"),
+                effective_on__lte=day or timezone.localdate(),
+            )
+            .order_by("-effective_on")
+            .values("price")[:1]
+        )
+        price = models.Subquery(latest)
+        if with_default:
+            price = Coalesce(price, F("default_price"))
+        return dict(
+            Item.objects.filter(pk__in=item_ids)
+            .annotate(price_as_of=price)
+            .values_list("pk", "price_as_of")
+        )
+
+    def record(self, items, day=None):
+        """Record the default_price of the items as effective on `day` where it changed"""
+        day = day or timezone.localdate()
+        items = list(items)
+        history = self.history_as_of([item.pk for item in items], day)
+        changed = {}
+        for item in items:
+            recorded = history.get(item.pk)
+            if recorded == item.default_price:
+                continue
+            if recorded is None and not item.default_price:
+                continue  # never priced
+            changed[item.pk] = item.default_price
+        if not changed:
+            return
+        existing = list(self.filter(item_id__in=changed, effective_on=day))
+        for price in existing:
+            price.price = changed.pop(price.item_id)
+        self.bulk_update(existing, ["price"])
+        self.bulk_create(
+            self.model(item_id=pk, price=price, effective_on=day)
+            for pk, price in changed.items()
+        )
+
+
+class ItemPrice(models.Model):
+    """Price of an item from effective_on until the next one takes over"""
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="prices")
+    price = models.DecimalField(max_digits=30, decimal_places=2)
+    effective_on = models.DateField(default=timezone.localdate)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    objects = ItemPriceManager()
+
+    class Meta:
+        constraints = [
+            # its index also serves "latest price on or before a day" lookups
+            models.UniqueConstraint(
+                fields=["item", "effective_on"], name="unique_item_price_day"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} at {self.price} from {self.effective_on}"
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def delete(self):
+        # a bulk delete skips OrderItem.delete, the totals are adjusted here
+        with transaction.atomic(using=self.db):
+            totals = locked_line_totals(self)
+            deleted = super().delete()
+            subtract_totals(totals)
+            return deleted
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
@@ -74,5 +292,145 @@ class OrderItem(models.Model):
         ),
     )
 
+    objects = OrderItemQuerySet.as_manager()
+
     def __str__(self):
         return f"Order#{self.order.id} - {self.item.id}"
+
+    @property
+    def total(self):
+        return line_total(self.price, self.quantity)
+
+    def locked_row(self):
+        """(order_id, price, quantity) of the stored line, locked until commit"""
+        return (
+            OrderItem.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values_list("order_id", "price", "quantity")
+            .first()
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            # the delta is taken against the locked row, not the one this instance
+            # was loaded from, so concurrent edits of a line add up
+            saved = None if self._state.adding else self.locked_row()
+            super().save(*args, **kwargs)
+            delta = self.total
+            if saved is not None:
+                order_id, price, quantity = saved
+                if order_id == self.order_id:
+                    delta -= line_total(price, quantity)
+                else:
+                    Order.objects.filter(pk=order_id).lines_changed(
+                        -line_total(price, quantity)
+                    )
+            Order.objects.filter(pk=self.order_id).lines_changed(delta)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            totals = locked_line_totals(OrderItem.objects.filter(pk=self.pk))
+            deleted = super().delete(*args, **kwargs)
+            subtract_totals(totals)
+            return deleted
+
+
+def locked_line_totals(lines):
+    """
+    Total of the order lines per order, for lines that are about to be deleted.
+    Call it in the deleting transaction, the lines stay locked until it ends.
+    """
+    totals = defaultdict(Decimal)
+    rows = lines.select_for_update().values_list("order_id", "price", "quantity")
+    for order_id, price, quantity in rows:
+        totals[order_id] += line_total(price, quantity)
+    return totals
+
+
+def subtract_totals(totals):
+    """
+    Take the locked_line_totals() out of their orders' totals once the lines
+    are deleted, lines_changed refreshes the rollups from what is left
+    """
+    for order_id, total in totals.items():
+        Order.objects.filter(pk=order_id).lines_changed(-total)
+
+
+def receipt_upload_to(instance, filename):
+    return f"receipts/{instance.order_id}/{instance.version}.pdf"
+
+
+class Receipt(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    version = models.CharField(max_length=64)
+    state = models.CharField(
+        max_length=1,
+        choices=(
+            (ReceiptState.PENDING, "Pending"),
+            (ReceiptState.RENDERING, "Rendering"),
+            (ReceiptState.READY, "Ready"),
+            (ReceiptState.FAILED, "Failed"),
+        ),
+        default=ReceiptState.PENDING,
+    )
+    file = models.FileField(upload_to=receipt_upload_to, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    claimed_on = models.DateTimeField(blank=True, null=True)
+    rendered_on = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order", "version"], name="unique_receipt_version"
+            )
+        ]
+
+    def __str__(self):
+        return f"Receipt for Order#{self.order_id} ({self.version[:8]})"
+
+
+class DailyCustomerSales(models.Model):
+    """Delivered orders of a customer, rolled up by the day they were placed"""
+
+    day = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    orders = models.PositiveIntegerField(default=0)
+    lines = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=30, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "customer"], name="unique_customer_sales_day"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["customer", "day"], name="customer_sales_day"),
+        ]
+
+
+class DailyItemSales(models.Model):
+    """Delivered quantity and revenue of an item per customer, unit and day"""
+
+    day = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+    unit = models.CharField(max_length=10)
+    quantity = models.FloatField(default=0)
+    lines = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=30, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "customer", "item", "unit"],
+                name="unique_item_sales_day",
+            )
+        ]
+        indexes = [
+            models.Index(fields=["item", "day"], name="item_sales_day"),
+            models.Index(
+                fields=["customer", "item", "day"], name="customer_item_sales_day"
+            ),
+        ]
@@ -0,0 +1,190 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class OrderPagination(LimitOffsetPagination):
+    """
+    Limit/offset pages by default, keyset pages over (-created_on, -id) once the
+    client sends a `cursor` (an empty one starts at the newest order). Keyset pages
+    never count the table, offset pages skip the count with `count=false`.
+    """
+
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.keyset = self.cursor_query_param in request.query_params
+        if self.keyset:
+            return self.paginate_keyset(queryset, request)
+        if request.query_params.get(self.count_query_param, "").lower() != "false":
+            return super().paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.count = None
+        rows = list(queryset[self.offset : self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[: self.limit]
+
+    def paginate_keyset(self, queryset, request):
+        self.limit = self.get_limit(request) or self.default_limit
+        reverse, position = self.decode_cursor(request)
+        queryset = self.keyset_queryset(queryset, reverse, position)
+        rows = list(queryset[: self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[: self.limit]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def keyset_queryset(self, queryset, reverse, position):
+        queryset = queryset.order_by("-created_on", "-id")
+        if position is not None:
+            created_on, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created_on__gt=created_on) | Q(created_on=created_on, id__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_on__lt=created_on) | Q(created_on=created_on, id__lt=pk)
+                )
+        if reverse:
+            queryset = queryset.reverse()
+        return queryset
+
+    def streams(self, request):
+        """Whether the requested page is large enough to be streamed"""
+        limit = self.get_limit(request)
+        return limit is not None and limit >= settings.STREAM_MIN_ROWS
+
+    def paginate_stream(self, queryset, request):
+        """
+        Like paginate_queryset, but the page is read lazily in chunks. The next
+        and previous links are only known once it has been consumed.
+        """
+        self.request = request
+        self.keyset = self.cursor_query_param in request.query_params
+        self.limit = self.get_limit(request)
+        if self.keyset:
+            reverse, position = self.decode_cursor(request)
+            if reverse:
+                # read backwards and flipped in memory, nothing to gain
+                return self.paginate_keyset(queryset, request)
+            self.has_previous = position is not None
+            queryset = self.keyset_queryset(queryset, reverse, position)
+            rows = queryset[: self.limit + 1]
+        else:
+            self.offset = self.get_offset(request)
+            if request.query_params.get(self.count_query_param, "").lower() != "false":
+                self.count = self.get_count(queryset)
+                rows = queryset[self.offset : self.offset + self.limit]
+            else:
+                self.count = None
+                rows = queryset[self.offset : self.offset + self.limit + 1]
+        self.page = []
+        return self.lookahead(rows.iterator(chunk_size=settings.STREAM_CHUNK_SIZE))
+
+    def lookahead(self, rows):
+        """Yield up to limit rows, noting whether more followed and the page bounds"""
+        self.has_next = False
+        for index, row in enumerate(rows):
+            if index == self.limit:
+                self.has_next = True
+                break
+            if index == 0:
+                self.page = [row, row]
+            self.page[-1] = row
+            yield row
+
+    def get_stream_parts(self, results):
+        parts = [
+            ("results", results),
+            ("next", self.get_next_link),
+            ("previous", self.get_previous_link),
+        ]
+        if not self.keyset:
+            parts.insert(0, ("count", self.count))
+        return parts
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            reverse, created_on, pk = (
+                b64decode(encoded.encode("ascii")).decode("ascii").split("|")
+            )
+            created_on = parse_datetime(created_on)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if created_on is None:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse == "r", (created_on, pk)
+
+    def encode_cursor(self, order, reverse):
+        if isinstance(order, dict):
+            created_on, pk = order["created_on"], order["id"]
+        else:
+            created_on, pk = order.created_on, order.id
+        raw = f"{'r' if reverse else 'f'}|{created_on.isoformat()}|{pk}"
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.cursor_query_param, b64encode(raw.encode("ascii")).decode()
+        )
+
+    def get_next_link(self):
+        if self.keyset:
+            if not self.has_next or not self.page:
+                return None
+            return self.encode_cursor(self.page[-1], reverse=False)
+        if self.count is None:
+            if not self.has_next:
+                return None
+            url = self.request.build_absolute_uri()
+            url = replace_query_param(url, self.limit_query_param, self.limit)
+            return replace_query_param(
+                url, self.offset_query_param, self.offset + self.limit
+            )
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset:
+            if not self.has_previous or not self.page:
+                return None
+            return self.encode_cursor(self.page[0], reverse=True)
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return Response(
+                OrderedDict(
+                    [
+                        ("next", self.get_next_link()),
+                        ("previous", self.get_previous_link()),
+                        ("results", data),
+                    ]
+                )
+            )
+        return super().get_paginated_response(data)
@@ -0,0 +1,99 @@
+import hashlib
+import logging
+
+import pdfkit
+from django.core.files.base import ContentFile
+from django.template import loader
+from django.utils import timezone
+
+from api.models import CENT, Order, Receipt, ReceiptState
+
+
+def receipt_version(order):
+    """
+    Hash of the receipt's HTML, so whatever is printed on it, from the order,
+    its lines or the template, changes the version
+    """
+    order = Order.objects.with_lines().get(pk=order.pk)
+    return hashlib.sha256(render_receipt_html(order).encode("utf-8")).hexdigest()
+
+
+def get_or_queue_receipt(order):
+    """Return the receipt for the current version of the order, queueing it if new"""
+    version = receipt_version(order)
+    receipt, created = Receipt.objects.get_or_create(order_id=order.id, version=version)
+    if created:
+        logging.info(f"queued receipt {version} for order {order.id}")
+    elif receipt.state == ReceiptState.FAILED:
+        Receipt.objects.filter(id=receipt.id).update(
+            state=ReceiptState.PENDING, error=None
+        )
+        receipt.state = ReceiptState.PENDING
+    return receipt
+
+
+def render_receipt_html(order):
+    from api.serializers import OrderDetailSerializer
+
+    context = OrderDetailSerializer(instance=order).data
+    # order comes from with_lines(), its lines carry the amount computed in SQL
+    for item, line in zip(context["items"], order.orderitem_set.all()):
+        item["total"] = line.amount.quantize(CENT) if line.price is not None else ""
+    template = loader.get_template("api/receipt.html")
+    return template.render(context)
+
+
+def claim(receipt_id):
+    """Atomically move a pending receipt to rendering, False if someone else has it"""
+    return bool(
+        Receipt.objects.filter(id=receipt_id, state=ReceiptState.PENDING).update(
+            state=ReceiptState.RENDERING, claimed_on=timezone.now()
+        )
+    )
+
+
+def render_receipt(receipt_id):
+    if not claim(receipt_id):
+        return False
+    receipt = Receipt.objects.get(id=receipt_id)
+    try:
+        order = Order.objects.with_lines().get(pk=receipt.order_id)
+        html_content = render_receipt_html(order)
+        pdf = pdfkit.from_string(html_content, False)
+    except Exception as exc:
+        logging.exception(f"failed to render {receipt}")
+        Receipt.objects.filter(id=receipt_id).update(
+            state=ReceiptState.FAILED, error=str(exc)
+        )
+        return False
+    receipt.file.save(f"{receipt.version}.pdf", ContentFile(pdf), save=False)
+    receipt.state = ReceiptState.READY
+    receipt.rendered_on = timezone.now()
+    receipt.save(update_fields=["file", "state", "rendered_on"])
+    prune_receipts(receipt)
+    return True
+
+
+def prune_receipts(receipt):
+    """Drop receipts of older versions of the same order once a newer one is ready"""
+    stale = Receipt.objects.filter(
+        order_id=receipt.order_id, created_on__lt=receipt.created_on
+    ).exclude(state__in=(ReceiptState.PENDING, ReceiptState.RENDERING))
+    for old in stale:
+        if old.file:
+            old.file.delete(save=False)
+        old.delete()
+
+
+def pending_receipts(limit=None):
+    queryset = Receipt.objects.filter(state=ReceiptState.PENDING).order_by("created_on")
+    if limit:
+        queryset = queryset[:limit]
+    return list(queryset.values_list("id", flat=True))
+
+
+def requeue_stale(older_than):
+    """Put back receipts whose worker died mid render"""
+    return Receipt.objects.filter(
+        state=ReceiptState.RENDERING, claimed_on__lt=timezone.now() - older_than
+    ).update(state=ReceiptState.PENDING)
@@ -0,0 +1,126 @@
+"""
+Sales rollups of delivered orders, bucketed by the local day an order was
+placed. A rollup covers one (day, customer) at a time, so whenever a delivered
+order changes, or an order enters or leaves the delivered state, the rollups
+of its day and customer are recomputed from its lines. `rebuildreports`
+recomputes all of them.
+"""
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.models import (
+    DailyCustomerSales,
+    DailyItemSales,
+    Order,
+    OrderItem,
+    OrderState,
+    line_total,
+)
+
+
+def delivered_lines(orders):
+    """Lines of the delivered orders, grouped by (day, customer)"""
+    return (
+        OrderItem.objects.filter(
+            order__in=orders.filter(state=OrderState.DELIVERED).values("pk")
+        )
+        .annotate(day=TruncDate("order__created_on"))
+        .order_by("day", "order__customer_id")
+        .values_list(
+            "day",
+            "order__customer_id",
+            "order_id",
+            "item_id",
+            "unit",
+            "quantity",
+            "price",
+        )
+    )
+
+
+def rollups(lines):
+    """Yield a DailyCustomerSales and its DailyItemSales per (day, customer)"""
+    for (day, customer_id), group in groupby(lines, key=itemgetter(0, 1)):
+        customer = DailyCustomerSales(
+            day=day, customer_id=customer_id, revenue=Decimal("0.00")
+        )
+        items = {}
+        orders = set()
+        for _, _, order_id, item_id, unit, quantity, price in group:
+            amount = line_total(price, quantity)
+            item = items.get((item_id, unit))
+            if item is None:
+                item = items[item_id, unit] = DailyItemSales(
+                    day=day,
+                    customer_id=customer_id,
+                    item_id=item_id,
+                    unit=unit,
+                    revenue=Decimal("0.00"),
+                )
+            item.quantity += quantity
+            item.revenue += amount
+            item.lines += 1
+            orders.add(order_id)
+            customer.revenue += amount
+            customer.lines += 1
+        customer.orders = len(orders)
+        yield customer, list(items.values())
+
+
+def save_rollups(lines, batch_size=1000):
+    customers, items = [], []
+    for customer, customer_items in rollups(lines):
+        customers.append(customer)
+        items.extend(customer_items)
+        if len(items) >= batch_size:
+            DailyCustomerSales.objects.bulk_create(customers)
+            DailyItemSales.objects.bulk_create(items)
+            customers, items = [], []
+    DailyCustomerSales.objects.bulk_create(customers)
+    DailyItemSales.objects.bulk_create(items)
+
+
+def rollup_key(customer_id, created_on):
+    return timezone.localdate(created_on), customer_id
+
+
+@transaction.atomic
+def refresh(keys):
+    """Recompute the rollups of these (day, customer_id) pairs"""
+    for day, customer_id in set(keys):
+        DailyCustomerSales.objects.filter(day=day, customer_id=customer_id).delete()
+        DailyItemSales.objects.filter(day=day, customer_id=customer_id).delete()
+        orders = Order.objects.filter(customer_id=customer_id, created_on__date=day)
+        save_rollups(delivered_lines(orders))
+
+
+def refresh_delivered(orders):
+    """Refresh the rollups of those of the orders that are delivered"""
+    keys = [
+        rollup_key(customer_id, created_on)
+        for customer_id, created_on in orders.filter(
+            state=OrderState.DELIVERED
+        ).values_list("customer_id", "created_on")
+    ]
+    if keys:
+        refresh(keys)
+
+
+@transaction.atomic
+def rebuild(since=None, chunk_size=2000):
+    """Recompute every rollup, or those of days from `since` on"""
+    customers = DailyCustomerSales.objects.all()
+    items = DailyItemSales.objects.all()
+    orders = Order.objects.all()
+    if since is not None:
+        customers = customers.filter(day__gte=since)
+        items = items.filter(day__gte=since)
+        orders = orders.filter(created_on__date__gte=since)
+    customers.delete()
+    items.delete()
+    save_rollups(delivered_lines(orders).iterator(chunk_size=chunk_size), chunk_size)
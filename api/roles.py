@@ -0,0 +1,67 @@
+import threading
+import time
+
+from django.conf import settings
+
+from api.models import Customer
+
+ADMIN = "admin"
+
+# user id -> (expires at, role names, customer id), shared by the threads of a
+# worker; signals in api.signals drop entries when memberships change and the
+# timeout bounds how long other worker processes can serve a stale entry
+_cache = {}
+_lock = threading.Lock()
+
+
+def _load(user):
+    roles = frozenset(user.groups.values_list("name", flat=True))
+    customer_id = (
+        Customer.objects.filter(user_id=user.pk).values_list("id", flat=True).first()
+    )
+    return roles, customer_id
+
+
+def _resolve(user):
+    """Roles and customer id of the user, memoized on the user for the request"""
+    resolved = getattr(user, "_oms_roles", None)
+    if resolved is not None:
+        return resolved
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user.pk)
+    if entry is not None and entry[0] > now:
+        resolved = entry[1:]
+    else:
+        resolved = _load(user)
+        with _lock:
+            _cache[user.pk] = (now + settings.ROLE_CACHE_TIMEOUT, *resolved)
+    user._oms_roles = resolved
+    return resolved
+
+
+def get_roles(user):
+    if not user.is_authenticated:
+        return frozenset()
+    return _resolve(user)[0]
+
+
+def get_customer_id(user):
+    if not user.is_authenticated:
+        return None
+    return _resolve(user)[1]
+
+
+def is_admin(user):
+    return ADMIN in get_roles(user)
+
+
+def invalidate(*user_ids):
+    with _lock:
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+def invalidate_all():
+    with _lock:
+        _cache.clear()
@@ -1,7 +1,61 @@
+from decimal import Decimal
 import logging
 from rest_framework import serializers
-from django.db.models import Sum, F, DecimalField
-from api.models import Customer, Item, Order, OrderItem, OrderState, User
+from django.db import transaction
+from django.db.models import (
+    Count,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    prefetch_related_objects,
+)
+from django.db.models.functions import Coalesce
+from api.models import (
+    Customer,
+    Item,
+    Order,
+    OrderItem,
+    OrderState,
+    User,
+    normalize_item_name,
+)
+from api.roles import get_customer_id
+
+
+def sparse_params(request):
+    """
+    Parse `?fields=a,b` and `?expand=customer`, None when the request asks for
+    neither and should get the full nested representation
+    """
+    if request is None:
+        return None
+    params = request.query_params
+    if "fields" not in params and "expand" not in params:
+        return None
+    fields = {f.strip() for f in params.get("fields", "").split(",") if f.strip()}
+    expand = {f.strip() for f in params.get("expand", "").split(",") if f.strip()}
+    return fields or None, expand
+
+
+class SparseFieldsMixin:
+    """
+    Keeps only the requested fields of the top level serializer, and sends
+    expandable relations as primary keys unless they are asked to be expanded
+    """
+
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sparse = sparse_params(self.context.get("request"))
+        if sparse is None:
+            return
+        fields, expand = sparse
+        for name in list(self.fields):
+            if fields is not None and name not in fields:
+                self.fields.pop(name)
+            elif name in self.expandable_fields and name not in expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -37,7 +91,7 @@ class CreateCustomerSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class DetailCustomerSerializer(serializers.ModelSerializer):
+class DetailCustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(source="user.username")
 
     class Meta:
@@ -59,9 +113,10 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 class OrderListSerializer(serializers.ModelSerializer):
+    # sparse lists are formatted by OrderListRows, this serializer sees full rows
     state = serializers.CharField(read_only=True)
     customer = DetailCustomerSerializer()
-    item_count = serializers.IntegerField(source="orderitem_set.count")
+    item_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Order
@@ -69,7 +124,8 @@ class OrderListSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         json_data = super().to_representation(instance)
-        json_data["state"] = OrderState.values[json_data["state"]]
+        if "state" in json_data:
+            json_data["state"] = OrderState.values[json_data["state"]]
         return json_data
 
 
@@ -87,11 +143,13 @@ class CreateOrderItemSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "quantity", "unit"]
 
     def validate_name(self, name):
-        return name and name.strip().lower()
+        return name and normalize_item_name(name)
 
     def create(self, validated_data):
-        item = validated_data.pop("item")
-        validated_data["item"], _ = Item.objects.get_or_create(**item)
+        name = validated_data.pop("item")["name"]
+        item = Item.objects.get_or_create_many([name])[name]
+        validated_data["item"] = item
+        validated_data["price"] = Item.objects.prices_as_of([item.pk])[item.pk]
         return super().create(validated_data)
 
 
@@ -104,16 +162,61 @@ class UpdateOrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ["id", "name", "quantity", "unit", "price"]
 
-    def update(self, instance, validated_data):
-        order_item = super().update(instance, validated_data)
 
-        order = order_item.order
-        order.total = order.orderitem_set.aggregate(
-            total=Sum(F("price") * F("quantity"), output_field=DecimalField())
-        )["total"]
-        order.save()
+class OrderTotalSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ["id", "total"]
+
+
+class OrderItemPriceListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        ids = [line["id"] for line in attrs]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each order item can appear only once")
+        known = set(
+            self.instance.orderitem_set.filter(id__in=ids).values_list("id", flat=True)
+        )
+        unknown = [line_id for line_id in ids if line_id not in known]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Items {unknown} do not belong to order #{self.instance.id}"
+            )
+        return attrs
+
+    @transaction.atomic
+    def update(self, order, validated_data):
+        updates = {line.pop("id"): line for line in validated_data}
+        lines = list(
+            order.orderitem_set.select_related("item")
+            .select_for_update()
+            .filter(id__in=updates)
+        )
+        fields = set()
+        delta = Decimal("0.00")
+        for line in lines:
+            delta -= line.total
+            for attr, value in updates[line.id].items():
+                setattr(line, attr, value)
+                fields.add(attr)
+            delta += line.total
+        if fields:
+            OrderItem.objects.bulk_update(lines, list(fields))
+        # bulk_update skips OrderItem.save, so the order total moves once here
+        Order.objects.filter(pk=order.pk).lines_changed(delta)
+        order.refresh_from_db(fields=["total", "updated_on"])
+        return lines
+
+
+class OrderItemPriceSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField(source="item.name", read_only=True)
 
-        return order_item
+    class Meta:
+        model = OrderItem
+        fields = ["id", "name", "price", "quantity", "unit"]
+        extra_kwargs = {"quantity": {"required": False}, "unit": {"required": False}}
+        list_serializer_class = OrderItemPriceListSerializer
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
@@ -142,15 +245,37 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             )
         return items
 
+    @transaction.atomic
     def create(self, validated_data):
-        user = self.context["user"]
+        customer_id = get_customer_id(self.context["user"])
+        if customer_id is None:
+            raise serializers.ValidationError("Only customers can place orders")
         validated_data["state"] = OrderState.CREATED
-        validated_data["customer_id"] = Customer.objects.get(user=user).id
+        validated_data["customer_id"] = customer_id
         orderitems = validated_data.pop("orderitem_set")
         order = super().create(validated_data)
+        items = Item.objects.get_or_create_many(
+            orderitem["item"]["name"] for orderitem in orderitems
+        )
+        prices = Item.objects.prices_as_of([item.pk for item in items.values()])
+        lines = []
         for orderitem in orderitems:
-            orderitem["order"] = order
-            CreateOrderItemSerializer().create(orderitem)
+            item = items[orderitem.pop("item")["name"]]
+            lines.append(
+                OrderItem(order=order, item=item, price=prices[item.pk], **orderitem)
+            )
+        OrderItem.objects.bulk_create(lines)
+        # bulk_create skips OrderItem.save, so account for the lines in one go
+        Order.objects.filter(pk=order.pk).lines_changed(
+            sum(line.total for line in lines)
+        )
+        # serve items and item_count of the response from one query
+        prefetch_related_objects(
+            [order],
+            Prefetch(
+                "orderitem_set", queryset=OrderItem.objects.select_related("item")
+            ),
+        )
         return order
 
 
@@ -163,17 +288,20 @@ class NestedOrderItemSerializer(serializers.ModelSerializer):
         exclude = ["item", "order"]
 
 
-class OrderDetailSerializer(serializers.ModelSerializer):
+class OrderDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = NestedOrderItemSerializer(source="orderitem_set", many=True)
     customer = DetailCustomerSerializer()
+    expandable_fields = ("customer",)
 
     class Meta:
         model = Order
         fields = ["id", "customer", "state", "comment", "created_on", "items", "total"]
+        read_only_fields = ["total"]
 
     def to_representation(self, instance):
         json_data = super().to_representation(instance)
-        json_data["state"] = OrderState.values[json_data["state"]]
+        if "state" in json_data:
+            json_data["state"] = OrderState.values[json_data["state"]]
         return json_data
 
     def update(self, instance, validated_data):
@@ -184,11 +312,153 @@ class OrderDetailSerializer(serializers.ModelSerializer):
             validated_data[
                 "comment"
             ] = f"Cancelled by - {self.context['user'].username}"
-        logging.info(validated_data)
-        return super().update(instance, validated_data)
+        logging.debug(validated_data)
+        serializers.raise_errors_on_nested_writes("update", self, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # total is maintained by order lines, never write back a stale copy
+        instance.save(update_fields=[*validated_data, "updated_on"])
+        return instance
 
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Item
         fields = "__all__"
+
+    def validate_name(self, name):
+        items = Item.objects.by_names([normalize_item_name(name)]).values()
+        if any(item.pk != getattr(self.instance, "pk", None) for item in items):
+            raise serializers.ValidationError("Item with this name already exists")
+        return name
+
+
+class ItemImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    default_price = serializers.DecimalField(
+        max_digits=30, decimal_places=2, min_value=0, required=False
+    )
+
+
+class OrderLineImportSerializer(serializers.Serializer):
+    item = serializers.CharField(max_length=100)
+    quantity = serializers.FloatField(min_value=0)
+    unit = serializers.ChoiceField(choices=OrderItem._meta.get_field("unit").choices)
+    price = serializers.DecimalField(
+        max_digits=30, decimal_places=2, min_value=0, required=False, allow_null=True
+    )
+
+
+class OrderImportSerializer(serializers.Serializer):
+    customer = serializers.IntegerField(required=False)
+    username = serializers.CharField(required=False)
+    state = serializers.CharField(default=OrderState.CREATED)
+    comment = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    lines = OrderLineImportSerializer(many=True, allow_empty=False)
+
+    def validate_state(self, state):
+        labels = {label.lower(): code for code, label in OrderState.values.items()}
+        state = labels.get(state.lower(), state)
+        if state not in OrderState.values:
+            raise serializers.ValidationError(f"Unknown state {state}")
+        return state
+
+    def validate(self, attrs):
+        if "customer" not in attrs and "username" not in attrs:
+            raise serializers.ValidationError("Either customer or username is required")
+        return attrs
+
+
+class ReportQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    customer = serializers.IntegerField(required=False)
+    item = serializers.IntegerField(required=False)
+    interval = serializers.ChoiceField(choices=["day", "week", "month"], default="day")
+
+    def validate(self, attrs):
+        if "start" in attrs and "end" in attrs and attrs["start"] > attrs["end"]:
+            raise serializers.ValidationError("start must not be after end")
+        return attrs
+
+
+def optional(to_representation):
+    return lambda value: None if value is None else to_representation(value)
+
+
+class OrderListRows:
+    """
+    Builds what OrderListSerializer returns for a sparse request straight from
+    .values() rows, without model instances or per instance field introspection
+    """
+
+    customer_columns = {
+        "id": "customer_id",
+        "user": "customer__user_id",
+        "username": "customer__user__username",
+        "ship": "customer__ship",
+        "supervisor": "customer__supervisor",
+        "contact": "customer__contact",
+    }
+    formatters = {
+        "state": OrderState.values.get,
+        "created_on": optional(serializers.DateTimeField().to_representation),
+        "updated_on": optional(serializers.DateTimeField().to_representation),
+        "total": optional(
+            serializers.DecimalField(max_digits=30, decimal_places=2).to_representation
+        ),
+    }
+    order_columns = [
+        "id",
+        "state",
+        "comment",
+        "created_on",
+        "updated_on",
+        "total",
+        "item_count",
+    ]
+
+    def __init__(self, fields, expand):
+        self.fields = [
+            f
+            for f in self.order_columns + ["customer"]
+            if fields is None or f in fields
+        ]
+        self.expand_customer = "customer" in expand
+
+    def values(self, queryset):
+        columns = {"id", "created_on"}  # always there for keyset pagination
+        columns.update(f for f in self.fields if f != "customer")
+        if "item_count" in columns:
+            # counted per row of the page, not grouped over the whole table
+            lines = (
+                OrderItem.objects.filter(order=OuterRef("pk"))
+                .order_by()
+                .values("order")
+                .annotate(count=Count("id"))
+                .values("count")
+            )
+            queryset = queryset.annotate(item_count=Coalesce(Subquery(lines), 0))
+        if "customer" in self.fields:
+            if self.expand_customer:
+                columns.update(self.customer_columns.values())
+            else:
+                columns.add("customer_id")
+        return queryset.values(*columns)
+
+    def format(self, rows):
+        formatters = [
+            (f, self.formatters.get(f)) for f in self.fields if f != "customer"
+        ]
+        with_customer = "customer" in self.fields
+        data = []
+        for row in rows:
+            item = {f: fmt(row[f]) if fmt else row[f] for f, fmt in formatters}
+            if with_customer and self.expand_customer:
+                item["customer"] = {
+                    key: row[column] for key, column in self.customer_columns.items()
+                }
+            elif with_customer:
+                item["customer"] = row["customer_id"]
+            data.append(item)
+        return data
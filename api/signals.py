@@ -0,0 +1,112 @@
+from django.contrib.auth.models import Group
+from rest_framework.authtoken.models import Token
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api import authentication, cache, events, reports, roles
+from api.models import (
+    Customer,
+    Item,
+    ItemPrice,
+    Order,
+    OrderItem,
+    OrderState,
+    User,
+    order_lines_changed,
+    locked_line_totals,
+    subtract_totals,
+)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        roles.invalidate(instance.pk)
+    elif pk_set:
+        roles.invalidate(*pk_set)
+    else:
+        # group.user_set.clear() does not report which users it removed
+        roles.invalidate_all()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    roles.invalidate_all()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    roles.invalidate(instance.pk)
+    # deactivated users must stop authenticating right away
+    authentication.invalidate_user(instance.pk)
+    # the customer profile shows the username
+    customer_ids = Customer.objects.filter(user_id=instance.pk).values_list(
+        "id", flat=True
+    )
+    if customer_ids:
+        cache.bump_version(
+            cache.CUSTOMERS, *map(cache.customer_namespace, customer_ids)
+        )
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    authentication.invalidate(instance.key)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def customer_changed(sender, instance, **kwargs):
+    roles.invalidate(instance.user_id)
+    cache.bump_version(cache.CUSTOMERS, cache.customer_namespace(instance.pk))
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    events.publish_orders(Order.objects.filter(pk=instance.pk))
+    if created and instance.state != OrderState.DELIVERED:
+        return
+    if update_fields is None or "state" in update_fields:
+        # entering or leaving the delivered state moves the order's lines in or out
+        reports.refresh([reports.rollup_key(instance.customer_id, instance.created_on)])
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    cache.bump_version(cache.ORDERS)
+    if instance.state == OrderState.DELIVERED:
+        reports.refresh([reports.rollup_key(instance.customer_id, instance.created_on)])
+
+
+@receiver(order_lines_changed, sender=Order)
+def order_lines_updated(sender, orders, **kwargs):
+    reports.refresh_delivered(orders)
+
+
+@receiver(post_save, sender=Item)
+def item_saved(sender, instance, raw=False, **kwargs):
+    cache.bump_version(cache.ITEMS)
+    if not raw:
+        ItemPrice.objects.record([instance])
+
+
+@receiver(pre_delete, sender=Item)
+def item_deleting(sender, instance, **kwargs):
+    # the item's order lines are deleted by cascade, without OrderItem.delete,
+    # their totals are taken out of the orders once they are gone
+    instance.line_totals = locked_line_totals(
+        OrderItem.objects.filter(item_id=instance.pk)
+    )
+
+
+@receiver(post_delete, sender=Item)
+def item_deleted(sender, instance, **kwargs):
+    subtract_totals(getattr(instance, "line_totals", {}))
+    cache.bump_version(cache.ITEMS)
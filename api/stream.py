@@ -0,0 +1,183 @@
+"""
+ASGI endpoint streaming order changes as server-sent events. Customers receive
+their own orders, admins can ask for every order with `?all=1`. EventSource
+cannot send headers, so browsers first POST to the ticket view for a one-time
+ticket and connect with `?ticket=`, which keeps API tokens out of URLs and
+access logs. Other clients may send the usual Authorization header.
+
+The route bypasses Django's middleware, the CORS headers are added here. Only
+the changes made in this process are streamed, see api.events.
+"""
+import asyncio
+import json
+import re
+import secrets
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from corsheaders.conf import conf as cors
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.authentication import resolve_token
+from api.events import broker
+from api.models import User
+from api.roles import get_customer_id, is_admin
+
+PATH = "/order/events/"
+
+
+def ticket_key(ticket):
+    return f"oms:stream-ticket:{ticket}"
+
+
+def issue_ticket(user):
+    """A ticket opening one stream as user within EVENTS_TICKET_SECONDS"""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(ticket_key(ticket), user.pk, settings.EVENTS_TICKET_SECONDS)
+    return ticket
+
+
+def redeem_ticket(ticket):
+    """The user a ticket was issued to, None when unknown, expired or used"""
+    user_id = cache.get(ticket_key(ticket))
+    # only the request that manages to delete the ticket gets to use it
+    if user_id is None or not cache.delete(ticket_key(ticket)):
+        return None
+    return User.objects.filter(pk=user_id, is_active=True).first()
+
+
+def get_header(scope, header):
+    for name, value in scope.get("headers", []):
+        if name == header:
+            return value.decode("latin1")
+    return None
+
+
+def get_token(scope):
+    keyword, _, key = (get_header(scope, b"authorization") or "").partition(" ")
+    if keyword.lower() == "token":
+        return key.strip()
+    return None
+
+
+def cors_headers(scope):
+    """What CorsMiddleware would add for the request's Origin"""
+    origin = get_header(scope, b"origin")
+    if not origin:
+        return []
+    allowed = (
+        cors.CORS_ALLOW_ALL_ORIGINS
+        or origin in cors.CORS_ALLOWED_ORIGINS
+        or any(re.match(regex, origin) for regex in cors.CORS_ALLOWED_ORIGIN_REGEXES)
+    )
+    if not allowed:
+        return []
+    headers = [
+        (b"access-control-allow-origin", origin.encode("latin1")),
+        (b"vary", b"origin"),
+    ]
+    if cors.CORS_ALLOW_CREDENTIALS:
+        headers.append((b"access-control-allow-credentials", b"true"))
+    return headers
+
+
+@sync_to_async
+def authorize(key, ticket, want_all):
+    """customer id to stream, None for every order, False when not allowed"""
+    close_old_connections()
+    try:
+        if ticket:
+            user = redeem_ticket(ticket)
+        elif key:
+            try:
+                user = resolve_token(key).user
+            except AuthenticationFailed:
+                user = None
+        else:
+            user = None
+        if user is None:
+            return False
+        if want_all:
+            return None if is_admin(user) else False
+        return get_customer_id(user) or False
+    finally:
+        close_old_connections()
+
+
+async def send_error(send, status, message, headers=()):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), *headers],
+        }
+    )
+    await send(
+        {
+            "type": "http.response.body",
+            "body": json.dumps({"detail": message}).encode("utf-8"),
+        }
+    )
+
+
+def format_event(event):
+    return f"event: order\ndata: {json.dumps(event)}\n\n".encode("utf-8")
+
+
+async def order_events(scope, receive, send):
+    query = parse_qs(scope.get("query_string", b"").decode("latin1"))
+    want_all = query.get("all", ["0"])[0] in ("1", "true")
+    ticket = query.get("ticket", [None])[0]
+    headers = cors_headers(scope)
+    customer_id = await authorize(get_token(scope), ticket, want_all)
+    if customer_id is False:
+        await send_error(send, 403, "Not allowed to stream these orders", headers)
+        return
+
+    subscription = broker.subscribe(customer_id)
+    disconnected = None
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                    *headers,
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"", "more_body": True})
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        while True:
+            next_event = asyncio.ensure_future(subscription.queue.get())
+            await asyncio.wait(
+                {next_event, disconnected},
+                timeout=settings.EVENTS_KEEPALIVE_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not next_event.done():
+                next_event.cancel()
+            if disconnected.done():
+                break
+            if next_event.done() and not next_event.cancelled():
+                body = format_event(next_event.result())
+            else:
+                body = b": keepalive\n\n"
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+    finally:
+        broker.unsubscribe(subscription)
+        if disconnected is not None:
+            disconnected.cancel()
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
@@ -0,0 +1,60 @@
+"""
+Streaming JSON for large result sets. Rows are read, serialized and rendered
+a chunk at a time, so neither the serialized data nor the rendered body of the
+whole result is ever held by the worker.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def render_array(rows, format_chunk, renderer, chunk_size):
+    yield b"["
+    first = True
+    for chunk in chunked(rows, chunk_size):
+        data = format_chunk(chunk)
+        if not data:
+            continue
+        body = renderer.render(data)[1:-1]
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+def render_object(parts, renderer):
+    """
+    Render a JSON object from (key, value) pairs in order. A value may be a
+    generator of body chunks from render_array, or a callable evaluated only
+    once the parts before it are sent, e.g. links known after the rows.
+    """
+    yield b"{"
+    for index, (key, value) in enumerate(parts):
+        yield (b"," if index else b"") + renderer.render(key) + b":"
+        if callable(value):
+            value = value()
+        if hasattr(value, "__next__"):
+            yield from value
+        else:
+            # JSONRenderer renders None as an empty body
+            yield b"null" if value is None else renderer.render(value)
+    yield b"}"
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    def __init__(self, parts, renderer, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(render_object(parts, renderer), **kwargs)
+
+
+def stream_rows(rows, format_chunk, renderer):
+    return render_array(rows, format_chunk, renderer, settings.STREAM_CHUNK_SIZE)
@@ -1,14 +1,70 @@
+import csv
+from datetime import timedelta
+from functools import partial
+import gzip
+import json
 import logging
+import re
+import shutil
+from decimal import Decimal
+from io import BytesIO, StringIO
+import tempfile
+import threading
+import time
+from unittest import mock
+import brotli
+import psycopg2
+from psycopg2 import extensions
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.db.utils import ConnectionHandler, OperationalError
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from api.models import Order, OrderItem, OrderState, User
+from oms import asgi, compression, replicas
+from oms.db import pool as db_pool
+from oms.db.postgresql import base as postgresql
+from oms.metrics import registry
+from api import authentication, stream
+from api import cache as versions
+from api.receipts import receipt_version, render_receipt_html
+from api.renderers import ORJSONParser, ORJSONRenderer
+from api.models import (
+    Customer,
+    DailyCustomerSales,
+    DailyItemSales,
+    Item,
+    ItemPrice,
+    Order,
+    OrderItem,
+    OrderState,
+    Receipt,
+    ReceiptState,
+    User,
+)
 
 
 class BaseTest(TestCase):
     def setUp(self) -> None:
         logging.disable(logging.CRITICAL)
+        cache.clear()
         self.username = "1111111111"
         self.client = APIClient()
         self.client.login(username=self.username, password="admin")
@@ -89,7 +145,7 @@ class OrderTestCase(BaseTest):
             "items": [
                 {
                     "id": 1,
-                    "name": "rice",
+                    "name": "Rice",
                     "quantity": 1,
                     "unit": "kg",
                 }
@@ -118,6 +174,36 @@ class OrderTestCase(BaseTest):
         self.assertEquals(res.status_code, status.HTTP_201_CREATED)
         self.assertEquals(res.json()["state"], OrderState.CREATED)
 
+    def test_order_create_resolves_items_in_bulk(self):
+        url = reverse("order-list")
+        names = ["Rice", " banana", "wheat", "sugar"]
+        data = {"items": [{"name": n, "quantity": 1, "unit": "kg"} for n in names]}
+        res = self.client.post(url, data)
+        self.assertEquals(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json()["item_count"], 4)
+        self.assertEqual(Item.objects.count(), 5)
+        self.assertEqual(
+            [i["name"] for i in res.json()["items"]],
+            ["Rice", "Banana", "wheat", "sugar"],
+        )
+
+    def test_order_create_query_count_is_constant(self):
+        url = reverse("order-list")
+
+        def create(count):
+            items = [
+                {"name": f"item {i}", "quantity": i + 1, "unit": "kg"}
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(url, {"items": items})
+            self.assertEquals(res.status_code, status.HTTP_201_CREATED)
+            return len(ctx.captured_queries)
+
+        create(1)  # warm the role cache
+        self.assertEqual(create(2), create(50))
+        self.assertEqual(Item.objects.count(), 53)
+
 
 class OrderAdminTestCase(BaseTest):
     fixtures = ["fixtures/core.json", "fixtures/admin2.json", "fixtures/customer3.json"]
@@ -155,6 +241,1564 @@ class OrderAdminTestCase(BaseTest):
         self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class OrderTotalTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        self.order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        self.line = OrderItem.objects.create(
+            order=self.order, item_id=1, quantity=2, unit="kg"
+        )
+        return super().setUp()
+
+    def total(self):
+        self.order.refresh_from_db()
+        return self.order.total
+
+    def test_total_follows_line_edits(self):
+        url = reverse("orderitem-detail", args=(self.line.id,))
+        res = self.client.patch(url, {"price": "10.50"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.total(), Decimal("21.00"))
+
+        res = self.client.patch(url, {"quantity": 3})
+        self.assertEqual(self.total(), Decimal("31.50"))
+
+        OrderItem.objects.create(
+            order=self.order, item_id=2, quantity=1.5, unit="kg", price="3"
+        )
+        self.assertEqual(self.total(), Decimal("36.00"))
+
+        res = self.client.delete(url)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.total(), Decimal("4.50"))
+
+    def test_stale_line_instances_add_up(self):
+        first = OrderItem.objects.get(pk=self.line.pk)
+        second = OrderItem.objects.get(pk=self.line.pk)
+        first.price = Decimal("10")
+        first.save()
+        second.price = Decimal("10")
+        second.quantity = 3
+        second.save()
+        self.assertEqual(self.total(), Decimal("30.00"))
+
+    def test_total_follows_bulk_and_cascade_deletes(self):
+        OrderItem.objects.filter(pk=self.line.pk).update(price=Decimal("10"))
+        Order.objects.filter(pk=self.order.pk).update(total=Decimal("20.00"))
+        for item_id in (2, 3):
+            OrderItem.objects.create(
+                order=self.order, item_id=item_id, quantity=1, unit="kg", price="5"
+            )
+        self.assertEqual(self.total(), Decimal("30.00"))
+
+        self.order.orderitem_set.filter(item_id=2).delete()
+        self.assertEqual(self.total(), Decimal("25.00"))
+        Item.objects.filter(pk=1).delete()
+        self.assertEqual(self.total(), Decimal("5.00"))
+
+    def test_total_not_writable_on_order(self):
+        url = reverse("order-detail", args=(self.order.id,))
+        res = self.client.patch(url, {"state": OrderState.PROCESSING, "total": "99"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(self.total())
+
+    def test_checktotals_repairs_drift(self):
+        self.line.price = Decimal("5")
+        self.line.save()
+        Order.objects.filter(pk=self.order.pk).update(total=Decimal("1"))
+        out = StringIO()
+        call_command("checktotals", stdout=out)
+        self.assertIn("Found 1", out.getvalue())
+        self.assertEqual(self.total(), Decimal("1"))
+
+        call_command("checktotals", fix=True, stdout=out)
+        self.assertEqual(self.total(), Decimal("10.00"))
+
+
+class OrderPricesTestCase(BaseTest):
+    fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
+
+    def setUp(self) -> None:
+        self.order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        self.lines = OrderItem.objects.bulk_create(
+            [
+                OrderItem(order=self.order, item_id=i % 3 + 1, quantity=2, unit="kg")
+                for i in range(30)
+            ]
+        )
+        self.url = reverse("order-prices", args=(self.order.id,))
+        return super().setUp()
+
+    def test_prices_applied_in_bulk(self):
+        data = [{"id": line.id, "price": "1.25"} for line in self.lines]
+        data[0].update(quantity=4, unit="g")
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(self.url, data)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertLess(len(ctx.captured_queries), 15)
+        self.assertEqual(res.json()["total"], "77.50")
+        self.assertEqual(len(res.json()["items"]), 30)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal("77.50"))
+        first = OrderItem.objects.get(pk=self.lines[0].pk)
+        self.assertEqual((first.quantity, first.unit), (4, "g"))
+
+    def test_prices_reject_foreign_lines(self):
+        other = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        line = OrderItem.objects.create(order=other, item_id=1, quantity=1, unit="kg")
+        data = [{"id": self.lines[0].id, "price": "1"}, {"id": line.id, "price": "1"}]
+        res = self.client.post(self.url, data)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(OrderItem.objects.filter(price__isnull=False).count(), 0)
+
+    def test_prices_not_allowed_for_other_customer(self):
+        self.client.login(username="3333333333", password="admin")
+        res = self.client.post(self.url, [{"id": self.lines[0].id, "price": "1"}])
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OrderListQueryTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+            OrderItem.objects.create(order=order, item_id=1, quantity=1, unit="kg")
+            OrderItem.objects.create(order=order, item_id=2, quantity=2, unit="kg")
+
+    def count_queries(self, url, limit):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, {"limit": limit})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), res.json()["results"]
+
+    def test_order_all_query_count_is_constant(self):
+        url = reverse("order-all")
+        self.create_orders(1)
+        self.count_queries(url, 1)  # warm the role cache
+        small, _ = self.count_queries(url, 1)
+        self.create_orders(20)
+        large, results = self.count_queries(url, 20)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(small, large)
+        self.assertEqual(results[0]["item_count"], 2)
+
+    def test_order_list_query_count_is_constant(self):
+        url = reverse("order-list")
+        self.create_orders(1)
+        self.count_queries(url, 1)  # warm the role cache
+        small, _ = self.count_queries(url, 1)
+        self.create_orders(20)
+        large, results = self.count_queries(url, 20)
+        self.assertEqual(small, large)
+        self.assertEqual(results[0]["customer"]["username"], self.username)
+
+
+class OrderDetailQueryTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        self.order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        self.add_lines(1)
+        self.url = reverse("order-detail", args=(self.order.id,))
+        return super().setUp()
+
+    def add_lines(self, count):
+        OrderItem.objects.bulk_create(
+            OrderItem(
+                order=self.order,
+                item_id=i % 3 + 1,
+                quantity=0.5,
+                price="0.05",
+                unit="kg",
+            )
+            for i in range(count)
+        )
+
+    def count_queries(self, request):
+        request()  # warm the role cache
+        with CaptureQueriesContext(connection) as ctx:
+            res = request()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_detail_and_update_query_count_is_constant(self):
+        requests = [
+            lambda: self.client.get(self.url),
+            lambda: self.client.patch(self.url, {"state": "P", "comment": "aft deck"}),
+        ]
+        small = [self.count_queries(request) for request in requests]
+        self.add_lines(30)
+        large = [self.count_queries(request) for request in requests]
+        self.assertEqual(small, large)
+        self.assertEqual(len(self.client.get(self.url).json()["items"]), 31)
+
+    def test_receipt_amounts_from_database(self):
+        order = Order.objects.with_lines().get(pk=self.order.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            html = render_receipt_html(order)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        # 0.05 * 0.5 rounds half up, in SQL and in line_total alike
+        self.assertIn("0.03", html)
+        self.assertEqual(order.orderitem_set.all()[0].total, Decimal("0.03"))
+
+
+class RoleCacheTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def test_roles_cached_across_requests(self):
+        order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        url = reverse("order-detail", args=(order.id,))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tables = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("auth_group", tables)
+
+    def test_group_change_invalidates_roles(self):
+        url = reverse("order-all")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        User.objects.get(username=self.username).groups.clear()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TokenAuthTestCase(TestCase):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        logging.disable(logging.CRITICAL)
+        authentication.invalidate_all()
+        self.client = APIClient()
+        return super().setUp()
+
+    def login(self, **extra):
+        res = self.client.post(
+            "/api-auth/", {"username": "1111111111", "password": "admin", **extra}
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def get_orders(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {key}")
+        return self.client.get(reverse("order-list"))
+
+    def test_token_cached_across_requests(self):
+        key = self.login()["token"]
+        self.assertEqual(self.get_orders(key).status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.get_orders(key)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tables = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("authtoken_token", tables)
+
+    def test_login_reports_expiry(self):
+        # tokens issued before expiry is turned on must keep working
+        self.assertIsNone(self.login()["expires_on"])
+        with override_settings(TOKEN_EXPIRY_SECONDS=3600):
+            data = self.login()
+            token = Token.objects.get(key=data["token"])
+            self.assertEqual(
+                data["expires_on"],
+                authentication.token_expires_on(token.created).isoformat(),
+            )
+
+    def test_rotate_revokes_old_token(self):
+        old = self.login()["token"]
+        self.assertEqual(self.get_orders(old).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login()["token"], old)
+        new = self.login(rotate="true")["token"]
+        self.assertNotEqual(new, old)
+        self.assertEqual(self.get_orders(old).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get_orders(new).status_code, status.HTTP_200_OK)
+
+    def test_expired_token_rejected_and_replaced(self):
+        key = self.login()["token"]
+        self.assertEqual(self.get_orders(key).status_code, status.HTTP_200_OK)
+        with override_settings(TOKEN_EXPIRY_SECONDS=1):
+            Token.objects.filter(key=key).update(
+                created=timezone.now() - timedelta(seconds=5)
+            )
+            authentication.invalidate(key)
+            res = self.get_orders(key)
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(str(res.data["detail"]), "Token has expired.")
+            self.assertNotEqual(self.login()["token"], key)
+
+    def test_deactivated_user_rejected(self):
+        key = self.login()["token"]
+        self.assertEqual(self.get_orders(key).status_code, status.HTTP_200_OK)
+        user = User.objects.get(username="1111111111")
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.get_orders(key).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class OrderConditionalGetTestCase(BaseTest):
+    fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
+
+    def setUp(self) -> None:
+        self.order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        self.line = OrderItem.objects.create(
+            order=self.order, item_id=1, quantity=1, unit="kg"
+        )
+        return super().setUp()
+
+    def assertNotModified(self, url, etag):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("api_orderitem", sql)
+
+    def test_order_detail_not_modified_until_lines_change(self):
+        url = reverse("order-detail", args=(self.order.id,))
+        etag = self.client.get(url)["ETag"]
+        self.assertNotModified(url, etag)
+
+        self.client.patch(
+            reverse("orderitem-detail", args=(self.line.id,)), {"unit": "g"}
+        )
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["items"][0]["unit"], "g")
+
+    def test_order_detail_etag_per_representation(self):
+        url = reverse("order-detail", args=(self.order.id,))
+        etag = self.client.get(url)["ETag"]
+        res = self.client.get(url, {"fields": "id,state"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_order_detail_forbidden_before_not_modified(self):
+        url = reverse("order-detail", args=(self.order.id,))
+        etag = self.client.get(url)["ETag"]
+        self.client.login(username="3333333333", password="admin")
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_order_list_not_modified_until_orders_change(self):
+        for name in ("order-list", "order-all"):
+            url = reverse(name)
+            etag = self.client.get(url)["ETag"]
+            self.assertNotModified(url, etag)
+
+            self.client.post(
+                reverse("order-add-item", args=(self.order.id,)),
+                {"name": "rice", "quantity": 1, "unit": "kg"},
+            )
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_order_list_changes_when_order_deleted(self):
+        other = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        url = reverse("order-list")
+        etag = self.client.get(url)["ETag"]
+        Order.objects.filter(pk=self.order.pk).delete()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([o["id"] for o in res.json()["results"]], [other.id])
+
+    def test_validators_follow_changes_made_by_another_process(self):
+        url = reverse("order-list")
+        res = self.client.get(url)
+        etag, modified = res["ETag"], res["Last-Modified"]
+
+        # another worker, with its own client of the shared cache, edits the profile
+        other = caches.create_connection("default")
+        later = mock.Mock(time=mock.Mock(return_value=time.time() + 5))
+        with mock.patch("api.cache.cache", other), mock.patch("api.cache.time", later):
+            customer = Customer.objects.get(pk=1)
+            customer.ship = "Ship9"
+            customer.save()
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["Last-Modified"], modified)
+
+
+class OrderPaginationTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        orders = [
+            Order.objects.create(customer_id=1, state=OrderState.CREATED)
+            for _ in range(25)
+        ]
+        # ties on created_on must be broken by id
+        Order.objects.filter(id__in=[o.id for o in orders[5:10]]).update(
+            created_on=orders[5].created_on
+        )
+        self.expected = list(
+            Order.objects.order_by("-created_on", "-id").values_list("id", flat=True)
+        )
+        return super().setUp()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", res.json())
+            ids.extend(order["id"] for order in res.json()["results"])
+            url, previous = res.json()["next"], res.json()["previous"]
+        return ids, previous
+
+    def test_cursor_pages_cover_all_orders(self):
+        for name in ("order-list", "order-all"):
+            ids, previous = self.walk(reverse(name) + "?cursor=&limit=10")
+            self.assertEqual(ids, self.expected)
+            res = self.client.get(previous)
+            back = [order["id"] for order in res.json()["results"]]
+            self.assertEqual(back, self.expected[10:20])
+
+    def test_invalid_cursor(self):
+        res = self.client.get(reverse("order-all"), {"cursor": "bogus"})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filter_by_state(self):
+        Order.objects.filter(id__in=self.expected[:3]).update(
+            state=OrderState.DELIVERED
+        )
+        res = self.client.get(reverse("order-all"), {"state": OrderState.DELIVERED})
+        self.assertEqual(res.json()["count"], 3)
+
+    def test_offset_pages_without_count(self):
+        url = reverse("order-all")
+        res = self.client.get(url, {"limit": 10, "offset": 20, "count": "false"})
+        self.assertIsNone(res.json()["count"])
+        self.assertIsNone(res.json()["next"])
+        self.assertEqual(len(res.json()["results"]), 5)
+        res = self.client.get(url, {"limit": 10, "count": "false"})
+        self.assertIn("offset=10", res.json()["next"])
+
+
+class OrderSparseFieldsTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        for quantity in (1, 2, 3):
+            order = Order.objects.create(
+                customer_id=1, state=OrderState.CREATED, comment="fragile"
+            )
+            OrderItem.objects.create(
+                order=order, item_id=1, quantity=quantity, price=2, unit="kg"
+            )
+        return super().setUp()
+
+    def results(self, name, **params):
+        res = self.client.get(reverse(name), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json()["results"]
+
+    def test_expanded_rows_match_serializer(self):
+        for name in ("order-list", "order-all"):
+            self.assertEqual(self.results(name, expand="customer"), self.results(name))
+
+    def test_only_requested_fields(self):
+        results = self.results("order-all", fields="id,state,total")
+        self.assertEqual(set(results[0]), {"id", "state", "total"})
+        self.assertEqual(results[0]["state"], "Created")
+        self.assertEqual(results[0]["total"], "6.00")
+
+    def test_customer_is_id_unless_expanded(self):
+        results = self.results("order-all", fields="id,customer")
+        self.assertEqual(results[0], {"id": results[0]["id"], "customer": 1})
+        results = self.results("order-all", fields="id,customer", expand="customer")
+        self.assertEqual(results[0]["customer"]["username"], self.username)
+
+    def test_sparse_cursor_pages(self):
+        url = reverse("order-all") + "?cursor=&limit=2&fields=id"
+        res = self.client.get(url).json()
+        self.assertEqual(len(res["results"]), 2)
+        res = self.client.get(res["next"]).json()
+        self.assertEqual(res["results"], [{"id": Order.objects.earliest("id").id}])
+
+    def test_order_detail_fields(self):
+        order = Order.objects.earliest("id")
+        url = reverse("order-detail", args=(order.id,))
+        res = self.client.get(url, {"fields": "id,total"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {"id": order.id, "total": "2.00"})
+        res = self.client.get(url, {"fields": "id,state"})
+        self.assertEqual(res.json(), {"id": order.id, "state": "Created"})
+
+    def test_customer_detail_fields(self):
+        url = reverse("customer-detail", args=(1,))
+        self.assertIn("ship", self.client.get(url).json())
+        res = self.client.get(url, {"fields": "id,username"})
+        self.assertEqual(res.json(), {"id": 1, "username": self.username})
+
+
+class OrderStreamingTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        for _ in range(7):
+            order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+            OrderItem.objects.create(order=order, item_id=1, quantity=1, unit="kg")
+        return super().setUp()
+
+    def get(self, url, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        if res.streaming:
+            return True, json.loads(b"".join(res.streaming_content))
+        return False, res.json()
+
+    def assertStreamedLikeBuffered(self, url, **params):
+        with self.settings(STREAM_MIN_ROWS=1000):
+            streamed, buffered = self.get(url, **params)
+        self.assertFalse(streamed)
+        with self.settings(STREAM_MIN_ROWS=5, STREAM_CHUNK_SIZE=2):
+            streamed, body = self.get(url, **params)
+        self.assertTrue(streamed)
+        self.assertEqual(body, buffered)
+        return body
+
+    def test_streamed_pages_match_buffered(self):
+        url = reverse("order-all")
+        body = self.assertStreamedLikeBuffered(url, limit=5)
+        self.assertEqual(body["count"], 7)
+        self.assertEqual(len(body["results"]), 5)
+        self.assertStreamedLikeBuffered(url, limit=5, offset=5)
+        self.assertStreamedLikeBuffered(url, limit=5, count="false")
+        self.assertStreamedLikeBuffered(url, limit=5, fields="id,item_count")
+        body = self.assertStreamedLikeBuffered(url, limit=5, cursor="")
+        self.assertStreamedLikeBuffered(body["next"])
+        self.assertStreamedLikeBuffered(reverse("order-list"), limit=50)
+
+
+class OrderExportTestCase(BaseTest):
+    fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
+
+    def setUp(self) -> None:
+        self.first = Order.objects.create(customer_id=1, state=OrderState.DELIVERED)
+        OrderItem.objects.create(
+            order=self.first, item_id=1, quantity=2, price="1.50", unit="kg"
+        )
+        OrderItem.objects.create(order=self.first, item_id=2, quantity=1, unit="kg")
+        self.empty = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        return super().setUp()
+
+    def export(self, **params):
+        res = self.client.get(reverse("order-export"), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("attachment", res["Content-Disposition"])
+        return b"".join(res.streaming_content).decode("utf-8")
+
+    def test_csv_has_a_row_per_line(self):
+        rows = list(csv.DictReader(StringIO(self.export(format="csv"))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["order_id"], str(self.first.id))
+        self.assertEqual(rows[0]["item"], "Rice")
+        self.assertEqual(rows[0]["line_total"], "3.00")
+        self.assertEqual(rows[0]["state"], "Delivered")
+        self.assertEqual(rows[2]["order_id"], str(self.empty.id))
+        self.assertEqual(rows[2]["line_id"], "")
+
+    def test_csv_formulas_escaped(self):
+        Order.objects.filter(pk=self.first.pk).update(comment="=HYPERLINK(1)")
+        Item.objects.filter(pk=1).update(name="@SUM(A1)")
+        rows = list(csv.DictReader(StringIO(self.export(format="csv"))))
+        self.assertEqual(rows[0]["comment"], "'=HYPERLINK(1)")
+        self.assertEqual(rows[0]["item"], "'@SUM(A1)")
+        self.assertEqual(rows[0]["line_total"], "3.00")
+        orders = [json.loads(line) for line in self.export(format="jsonl").splitlines()]
+        self.assertEqual(orders[0]["comment"], "=HYPERLINK(1)")
+
+    def test_jsonl_nests_lines(self):
+        orders = [json.loads(line) for line in self.export(format="jsonl").splitlines()]
+        self.assertEqual(
+            [o["order_id"] for o in orders], [self.first.id, self.empty.id]
+        )
+        self.assertEqual(
+            [line["item"] for line in orders[0]["lines"]], ["Rice", "Banana"]
+        )
+        self.assertEqual(orders[0]["total"], "3.00")
+        self.assertEqual(orders[1]["lines"], [])
+
+    def test_filters(self):
+        Order.objects.filter(pk=self.empty.pk).update(
+            created_on=timezone.now() - timedelta(days=10)
+        )
+        export = partial(self.export, format="jsonl")
+        self.assertEqual(len(export(state=OrderState.CREATED).splitlines()), 1)
+        self.assertEqual(export(customer=3), "")
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        orders = [
+            json.loads(line) for line in export(created_on__gte=since).splitlines()
+        ]
+        self.assertEqual([o["order_id"] for o in orders], [self.first.id])
+
+    def test_admin_only(self):
+        self.client.login(username="3333333333", password="admin")
+        res = self.client.get(reverse("order-export"), {"format": "csv"})
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ImportTestCase(BaseTest):
+    fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
+
+    def write(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = f"{directory}/{name}"
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_import_items_command(self):
+        path = self.write(
+            "items.csv",
+            "name,default_price\nRice,12.50\n Salt ,3\nsugar,-1\nsalt,4\n",
+        )
+        out, err = StringIO(), StringIO()
+        call_command("importdata", "items", path, stdout=out, stderr=err)
+        self.assertIn("Created 1, updated 1, failed 1 items", out.getvalue())
+        self.assertIn("row 4:", err.getvalue())
+        self.assertEqual(Item.objects.get(name="Rice").default_price, Decimal("12.50"))
+        self.assertEqual(Item.objects.get(name="salt").default_price, Decimal("4"))
+
+    def test_import_orders_csv(self):
+        path = self.write(
+            "orders.csv",
+            "order_ref,username,comment,item,quantity,unit,price\n"
+            "a,1111111111,weekly,rice,2,kg,1.50\n"
+            "a,,,Salt,1,kg,\n"
+            "b,3333333333,,rice,1,kg,2\n",
+        )
+        call_command("importdata", "orders", path, stdout=StringIO())
+        first, second = Order.objects.order_by("id")
+        self.assertEqual((first.customer_id, first.comment), (1, "weekly"))
+        self.assertEqual(first.total, Decimal("3.00"))
+        self.assertEqual(first.orderitem_set.count(), 2)
+        self.assertEqual(second.customer_id, 3)
+        self.assertEqual(first.state, OrderState.CREATED)
+
+    def test_import_orders_endpoint(self):
+        lines = [
+            {
+                "customer": 1,
+                "state": "Processing",
+                "lines": [
+                    {"item": "rice", "quantity": 2, "unit": "kg", "price": "1.25"}
+                ],
+            },
+            {"customer": 99, "lines": [{"item": "rice", "quantity": 1, "unit": "kg"}]},
+            {"customer": 1, "lines": [{"item": "rice", "quantity": 1, "unit": "box"}]},
+        ]
+        body = "\n".join(json.dumps(line) for line in lines) + "\n{oops\n"
+        upload = SimpleUploadedFile("orders.jsonl", body.encode("utf-8"))
+        res = self.client.post(
+            reverse("import", args=("orders",)), {"file": upload}, format="multipart"
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["created"], 1)
+        self.assertEqual(res.json()["failed"], 3)
+        self.assertEqual(sorted(e["row"] for e in res.json()["errors"]), [2, 3, 4])
+        order = Order.objects.get()
+        self.assertEqual(
+            (order.state, order.total), (OrderState.PROCESSING, Decimal("2.50"))
+        )
+
+    def test_import_endpoint_admin_only(self):
+        self.client.login(username="3333333333", password="admin")
+        upload = SimpleUploadedFile("items.csv", b"name\nsalt\n")
+        res = self.client.post(
+            reverse("import", args=("items",)), {"file": upload}, format="multipart"
+        )
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class SalesReportTestCase(BaseTest):
+    fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
+
+    def setUp(self) -> None:
+        self.order = Order.objects.create(customer_id=1, state=OrderState.PROCESSING)
+        self.line = OrderItem.objects.create(
+            order=self.order, item_id=1, quantity=2, price="1.50", unit="kg"
+        )
+        OrderItem.objects.create(
+            order=self.order, item_id=1, quantity=1, price="1.50", unit="kg"
+        )
+        return super().setUp()
+
+    def deliver(self, order, state=OrderState.DELIVERED):
+        order.state = state
+        order.save(update_fields=["state"])
+
+    def rollups(self):
+        return (
+            list(DailyCustomerSales.objects.values_list("orders", "lines", "revenue")),
+            list(DailyItemSales.objects.values_list("item_id", "quantity", "revenue")),
+        )
+
+    def test_rollups_follow_delivered_orders(self):
+        self.assertEqual(self.rollups(), ([], []))
+        self.deliver(self.order)
+        self.assertEqual(
+            self.rollups(), ([(1, 2, Decimal("4.50"))], [(1, 3.0, Decimal("4.50"))])
+        )
+        self.client.patch(
+            reverse("orderitem-detail", args=(self.line.id,)), {"price": "2.00"}
+        )
+        self.assertEqual(self.rollups()[1], [(1, 3.0, Decimal("5.50"))])
+        self.deliver(self.order, OrderState.PROCESSING)
+        self.assertEqual(self.rollups(), ([], []))
+
+    def test_rollups_follow_deleted_lines(self):
+        order = Order.objects.create(customer_id=3, state=OrderState.CREATED)
+        lines = [
+            OrderItem.objects.create(
+                order=order, item_id=item_id, quantity=1, price=price, unit="kg"
+            )
+            for item_id, price in ((1, "10.00"), (2, "7.00"), (3, "4.00"))
+        ]
+        self.deliver(order)
+        customer_rollup = DailyCustomerSales.objects.filter(customer_id=3)
+        self.assertEqual(
+            list(customer_rollup.values_list("lines", "revenue")),
+            [(3, Decimal("21.00"))],
+        )
+
+        lines[2].delete()
+        self.assertEqual(
+            list(customer_rollup.values_list("lines", "revenue")),
+            [(2, Decimal("17.00"))],
+        )
+        OrderItem.objects.filter(pk=lines[1].pk).delete()
+        self.assertEqual(
+            list(customer_rollup.values_list("lines", "revenue")),
+            [(1, Decimal("10.00"))],
+        )
+        # the cascade from the item also takes self.order's lines
+        Item.objects.filter(pk=1).delete()
+        self.assertEqual(customer_rollup.count(), 0)
+        order.refresh_from_db()
+        self.assertEqual(order.total, Decimal("0.00"))
+
+    def test_rebuild_matches_incremental(self):
+        self.deliver(self.order)
+        other = Order.objects.create(customer_id=3, state=OrderState.CREATED)
+        OrderItem.objects.create(order=other, item_id=2, quantity=4, unit="kg")
+        self.deliver(other)
+        incremental = self.rollups()
+        DailyItemSales.objects.all().delete()
+        out = StringIO()
+        call_command("rebuildreports", stdout=out)
+        self.assertIn("2 customer days and 2 item days", out.getvalue())
+        self.assertEqual(sorted(self.rollups()[1]), sorted(incremental[1]))
+        self.deliver(other, OrderState.CANCELLED)
+        self.assertEqual(DailyCustomerSales.objects.count(), 1)
+
+    def test_report_endpoints(self):
+        self.deliver(self.order)
+        month = timezone.localdate().replace(day=1).isoformat()
+        res = self.client.get(
+            reverse("report-items"), {"item": 1, "customer": 1, "interval": "month"}
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.json()["series"],
+            [
+                {
+                    "period": month,
+                    "item_id": 1,
+                    "item__name": "Rice",
+                    "unit": "kg",
+                    "quantity": 3.0,
+                    "lines": 2,
+                    "revenue": "4.50",
+                }
+            ],
+        )
+        res = self.client.get(reverse("report-customers"))
+        self.assertEqual(res.json()["series"][0]["orders"], 1)
+        res = self.client.get(reverse("report-customers"), {"interval": "year"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(reverse("report-customers"), {"item": 1})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("item", res.json())
+        self.client.login(username="3333333333", password="admin")
+        res = self.client.get(reverse("report-items"))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ItemPriceTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def test_new_lines_priced_from_items(self):
+        res = self.client.post(
+            reverse("order-list"),
+            {
+                "items": [
+                    {"name": "rice", "quantity": 2, "unit": "kg"},
+                    {"name": "Mango", "quantity": 1, "unit": "kg"},
+                    {"name": "salt", "quantity": 1, "unit": "kg"},
+                ]
+            },
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(pk=res.json()["id"])
+        prices = dict(order.orderitem_set.values_list("item__name", "price"))
+        self.assertEqual(
+            prices,
+            {"Rice": Decimal("100.00"), "Mango": Decimal("200.00"), "salt": None},
+        )
+        self.assertEqual(order.total, Decimal("400.00"))
+
+        self.client.post(
+            reverse("order-add-item", args=(order.id,)),
+            {"name": "banana", "quantity": 1, "unit": "kg"},
+        )
+        order.refresh_from_db()
+        self.assertEqual(order.total, Decimal("430.00"))
+
+    def test_price_as_of_day(self):
+        today = timezone.localdate()
+        rice = Item.objects.get(name="Rice")
+        rice.default_price = Decimal("110.00")
+        rice.save()
+        self.assertEqual(
+            list(rice.prices.values_list("price", "effective_on")),
+            [(Decimal("110.00"), today)],
+        )
+        ItemPrice.objects.create(
+            item=rice, price="120.00", effective_on=today + timedelta(days=7)
+        )
+        prices = Item.objects.prices_as_of
+        self.assertEqual(prices([1])[1], Decimal("110.00"))
+        self.assertEqual(prices([1], today + timedelta(days=8))[1], Decimal("120.00"))
+        # before any recorded price the default applies
+        self.assertEqual(prices([1, 2], today - timedelta(days=1))[2], Decimal("30.00"))
+
+    def test_reprice_open_orders(self):
+        order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        unpriced = OrderItem.objects.create(
+            order=order, item_id=1, quantity=1, unit="kg"
+        )
+        priced = OrderItem.objects.create(
+            order=order, item_id=2, quantity=2, price="25.00", unit="kg"
+        )
+        delivered = Order.objects.create(customer_id=1, state=OrderState.DELIVERED)
+        OrderItem.objects.create(order=delivered, item_id=1, quantity=1, unit="kg")
+
+        out = StringIO()
+        call_command("repriceorders", stdout=out)
+        self.assertIn("Repriced 1 lines of 1 orders", out.getvalue())
+        order.refresh_from_db()
+        self.assertEqual(order.total, Decimal("150.00"))
+
+        call_command("repriceorders", overwrite=True, stdout=out)
+        priced.refresh_from_db()
+        unpriced.refresh_from_db()
+        self.assertEqual((unpriced.price, priced.price), (100, 30))
+        order.refresh_from_db()
+        self.assertEqual(order.total, Decimal("160.00"))
+        self.assertIsNone(delivered.orderitem_set.get().price)
+
+
+class CompressionTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        for _ in range(30):
+            Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        return super().setUp()
+
+    def get(self, encoding, **params):
+        return self.client.get(
+            reverse("order-all"), {"limit": 30, **params}, HTTP_ACCEPT_ENCODING=encoding
+        )
+
+    def test_negotiates_encoding(self):
+        plain = self.get("identity").content
+        res = self.get("gzip, deflate, br")
+        self.assertEqual(res["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(res.content), plain)
+        self.assertTrue(res["ETag"].startswith("W/"))
+        self.assertIn("Accept-Encoding", res["Vary"])
+        res = self.get("gzip, br;q=0")
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(res.content), plain)
+        self.assertNotIn("Content-Encoding", self.get("identity"))
+
+    def test_small_responses_sent_as_is(self):
+        res = self.get("gzip", limit=1)
+        self.assertNotIn("Content-Encoding", res)
+        self.assertIn("Accept-Encoding", res["Vary"])
+
+    def test_conditional_get_with_compressed_etag(self):
+        etag = self.get("gzip")["ETag"]
+        res = self.client.get(
+            reverse("order-all"),
+            {"limit": 30},
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(STREAM_MIN_ROWS=5)
+    def test_streamed_response_compressed(self):
+        plain = b"".join(self.get("identity").streaming_content)
+        res = self.get("gzip")
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(res.streaming_content)), plain)
+
+    def test_streamed_brotli_not_worse_than_gzip(self):
+        rows = [f"{i},rice,2,kg,{i % 7}.50\r\n".encode() for i in range(20000)]
+        plain = b"".join(rows)
+        br = b"".join(compression.compress_stream("br", iter(rows)))
+        gz = b"".join(compression.compress_stream("gzip", iter(rows)))
+        self.assertEqual(brotli.decompress(br), plain)
+        self.assertLess(len(br), len(gz))
+
+
+class ExplainQueriesTestCase(TestCase):
+    fixtures = ["fixtures/core.json"]
+
+    def test_explain_main_queries(self):
+        Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        out = StringIO()
+        call_command("explainqueries", stdout=out)
+        self.assertIn("customer orders page", out.getvalue())
+        self.assertIn("order_customer_created", out.getvalue())
+
+
+class BenchmarkTestCase(TestCase):
+    fixtures = ["fixtures/core.json"]
+
+    def test_seed_and_benchmark(self):
+        out = StringIO()
+        call_command(
+            "seeddata", customers=3, items=5, orders=12, lines=4, seed=1, stdout=out
+        )
+        self.assertIn("Seeded 3 customers, 5 items, 12 orders", out.getvalue())
+        self.assertEqual(Order.objects.count(), 12)
+        self.assertEqual(
+            Order.objects.filter(
+                created_on__lt=Order.objects.latest("created_on").created_on
+            ).count(),
+            11,
+        )
+
+        lines = list(OrderItem.objects.values_list("id", "price").order_by("id"))
+        disabled = logging.root.manager.disable
+        out = StringIO()
+        call_command(
+            "benchmark",
+            repeat=2,
+            endpoints=["order-all", "order-detail", "add_item", "orderitem-update"],
+            host="testserver",
+            stdout=out,
+        )
+        self.assertIn("order-all", out.getvalue())
+        self.assertIn("p99 ms", out.getvalue())
+        # the writing endpoints are rolled back
+        self.assertEqual(
+            list(OrderItem.objects.values_list("id", "price").order_by("id")), lines
+        )
+        self.assertEqual(logging.root.manager.disable, disabled)
+
+    def test_benchmark_serializers(self):
+        out = StringIO()
+        call_command("benchserializers", repeat=2, lines=10, stdout=out)
+        self.assertIn("render-orjson", out.getvalue())
+        self.assertFalse(Order.objects.exists())
+
+
+class RendererTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def test_orjson_matches_stdlib(self):
+        data = {"total": "12.30", "name": "r\u2028ice", "lines": [1, 2.5]}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # raw decimals keep their cents instead of becoming floats
+        self.assertEqual(
+            ORJSONRenderer().render({"total": Decimal("12.30")}), b'{"total":"12.30"}'
+        )
+        body = JSONRenderer().render(data)
+        self.assertEqual(
+            ORJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body))
+        )
+
+    def test_orjson_parse_error(self):
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b"{"))
+
+    def test_no_browsable_api_without_debug(self):
+        order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        url = reverse("order-detail", args=(order.id,))
+        res = self.client.get(url, HTTP_ACCEPT="text/html")
+        self.assertEqual(res.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+        res = self.client.get(url)
+        self.assertEqual(res["Content-Type"], "application/json")
+        self.assertEqual(res.json()["id"], order.id)
+
+
+class MetricsTestCase(BaseTest):
+    fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
+
+    def setUp(self) -> None:
+        registry.reset()
+        return super().setUp()
+
+    def test_metrics_recorded_per_view(self):
+        Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        self.client.get(reverse("order-list"))
+        self.client.get(reverse("order-list"))
+        res = self.client.get(reverse("metrics"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        body = res.content.decode()
+        self.assertIn(
+            'oms_requests_total{view="order-list",method="GET",status="200"} 2', body
+        )
+        self.assertIn(
+            'oms_request_duration_seconds_count{view="order-list",method="GET"} 2',
+            body,
+        )
+        self.assertIn('oms_request_db_queries_bucket{view="order-list"', body)
+
+    def test_streamed_response_measured_until_closed(self):
+        order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        OrderItem.objects.create(order=order, item_id=1, quantity=1, unit="kg")
+        res = self.client.get(reverse("order-export"), {"format": "csv"})
+        self.assertNotIn('view="order-export"', registry.render())
+        size = len(b"".join(res.streaming_content))
+        body = registry.render()
+        labels = '{view="order-export",method="GET"}'
+        self.assertIn(f"oms_response_size_bytes_sum{labels} {size}", body)
+        # the export's rows are read while the body is sent
+        self.assertRegex(body, rf"oms_request_db_queries_sum{re.escape(labels)} [1-9]")
+
+    def test_serializer_time_recorded(self):
+        Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        self.client.get(reverse("order-list"))
+        body = registry.render()
+        self.assertRegex(
+            body,
+            r'oms_request_serializer_seconds_total\{view="order-list",method="GET"\}'
+            r" (?!0\n)[\d.e-]+",
+        )
+
+    def test_metrics_admin_only(self):
+        self.client.login(username="3333333333", password="admin")
+        res = self.client.get(reverse("metrics"))
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(SLOW_REQUEST_QUERIES=1)
+    def test_slow_request_logged_with_sql(self):
+        logging.disable(logging.NOTSET)
+        self.addCleanup(logging.disable, logging.CRITICAL)
+        with self.assertLogs(level="WARNING") as logs:
+            self.client.get(reverse("order-all"))
+        self.assertIn("Slow request GET /order/all/", logs.output[0])
+        self.assertIn("api_order", logs.output[0])
+
+
+@override_settings(EVENTS_KEEPALIVE_SECONDS=1)
+class OrderEventsTestCase(TransactionTestCase):
+    fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
+
+    def setUp(self) -> None:
+        logging.disable(logging.CRITICAL)
+        cache.clear()
+        self.admin_token = Token.objects.create(user_id=1).key
+        self.customer_token = Token.objects.create(
+            user=User.objects.get(username="3333333333")
+        ).key
+        self.order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        return super().setUp()
+
+    def connect(self, query, headers=()):
+        communicator = ApplicationCommunicator(
+            stream.order_events,
+            {
+                "type": "http",
+                "method": "GET",
+                "path": stream.PATH,
+                "query_string": query.encode(),
+                "headers": list(headers),
+            },
+        )
+        return communicator
+
+    def auth(self, token):
+        return [(b"authorization", f"Token {token}".encode())]
+
+    def get_ticket(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+        res = client.post(reverse("events-ticket"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json()["ticket"]
+
+    async def read_event(self, communicator):
+        while True:
+            message = await communicator.receive_output(timeout=3)
+            if message["body"].startswith(b"event:"):
+                return message["body"].decode()
+
+    async def test_stream_requires_token(self):
+        communicator = self.connect("")
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 403)
+
+    async def test_token_not_accepted_in_url(self):
+        communicator = self.connect(f"token={self.customer_token}")
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 403)
+
+    async def test_ticket_opens_one_stream(self):
+        ticket = await sync_to_async(self.get_ticket)(self.customer_token)
+        origin = (b"origin", b"http://localhost")
+        communicator = self.connect(f"ticket={ticket}", [origin])
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 200)
+        self.assertIn(
+            (b"access-control-allow-origin", b"http://localhost"), start["headers"]
+        )
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait(timeout=3)
+
+        communicator = self.connect(f"ticket={ticket}", [origin])
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 403)
+        self.assertIn(
+            (b"access-control-allow-origin", b"http://localhost"), start["headers"]
+        )
+
+    async def test_customer_cannot_stream_all(self):
+        communicator = self.connect("all=1", self.auth(self.customer_token))
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 403)
+
+    async def test_admin_firehose_receives_changes(self):
+        ticket = await sync_to_async(self.get_ticket)(self.admin_token)
+        communicator = self.connect(f"ticket={ticket}&all=1")
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output()
+        self.assertEqual(start["status"], 200)
+        await communicator.receive_output()  # opening empty chunk
+
+        def change():
+            OrderItem.objects.create(
+                order=self.order, item_id=1, quantity=2, unit="kg", price="5"
+            )
+
+        await sync_to_async(change)()
+        body = await self.read_event(communicator)
+        self.assertIn(f'"id": {self.order.id}', body)
+        self.assertIn('"total": "10.00"', body)
+
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait(timeout=3)
+
+    async def test_customer_stream_only_own_orders(self):
+        communicator = self.connect("", self.auth(self.customer_token))
+        await communicator.send_input({"type": "http.request"})
+        await communicator.receive_output()
+        await communicator.receive_output()
+
+        def change():
+            self.order.state = OrderState.PROCESSING
+            self.order.save()
+            Order.objects.create(customer_id=3, state=OrderState.CREATED)
+
+        await sync_to_async(change)()
+        body = await self.read_event(communicator)
+        self.assertIn('"customer_id": 3', body)
+        self.assertNotIn(f'"id": {self.order.id},', body)
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait(timeout=3)
+
+
+class ASGITestCase(TransactionTestCase):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        logging.disable(logging.CRITICAL)
+        cache.clear()
+        registry.reset()
+        self.token = Token.objects.create(user_id=1).key
+        for _ in range(3):
+            order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+            OrderItem.objects.create(order=order, item_id=1, quantity=1, unit="kg")
+        return super().setUp()
+
+    async def get(self, path, query="", headers=()):
+        communicator = ApplicationCommunicator(
+            asgi.application,
+            {
+                "type": "http",
+                "method": "GET",
+                "path": path,
+                "query_string": query.encode(),
+                "headers": [
+                    (b"authorization", f"Token {self.token}".encode()),
+                    *headers,
+                ],
+            },
+        )
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output(timeout=5)
+        body = b""
+        while True:
+            message = await communicator.receive_output(timeout=5)
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        return start, body
+
+    async def test_streamed_export(self):
+        # the export reads the database while it is sent
+        start, body = await self.get(reverse("order-export"), "format=csv")
+        self.assertEqual(start["status"], 200)
+        rows = list(csv.DictReader(StringIO(body.decode())))
+        self.assertEqual(len(rows), 3)
+        start, compressed = await self.get(
+            reverse("order-export"), "format=csv", [(b"accept-encoding", b"br")]
+        )
+        self.assertIn((b"Content-Encoding", b"br"), start["headers"])
+        self.assertEqual(brotli.decompress(compressed), body)
+
+    async def test_queries_counted(self):
+        start, body = await self.get(reverse("order-all"))
+        self.assertEqual(start["status"], 200)
+        self.assertEqual(json.loads(body)["count"], 3)
+        metrics = registry.render()
+        self.assertRegex(
+            metrics,
+            r'oms_request_db_queries_sum\{view="order-all",method="GET"\} [1-9]',
+        )
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def make_pool(self, alias, **options):
+        options = {"SIZE": 1, "MAX_OVERFLOW": 0, "TIMEOUT": 0.1, **options}
+        return db_pool.Pool(
+            alias,
+            ping=lambda conn: not conn.closed,
+            reset=lambda conn: None,
+            options=options,
+        )
+
+    def test_connection_reused(self):
+        pool = self.make_pool("pool-reuse")
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+        self.assertIs(pool.acquire(FakeConnection), first)
+        self.assertEqual(pool.metrics.connects, 1)
+
+    def test_timeout_when_all_in_use(self):
+        pool = self.make_pool("pool-timeout", MAX_OVERFLOW=1)
+        pool.acquire(FakeConnection)
+        pool.acquire(FakeConnection)
+        with self.assertRaises(db_pool.PoolTimeout):
+            pool.acquire(FakeConnection)
+        self.assertEqual(pool.metrics.timeouts, 1)
+
+    def test_waiter_gets_released_connection(self):
+        pool = self.make_pool("pool-wait", TIMEOUT=5)
+        conn = pool.acquire(FakeConnection)
+        threading.Timer(0.05, pool.release, [conn]).start()
+        self.assertIs(pool.acquire(FakeConnection), conn)
+        self.assertEqual(pool.metrics.wait.count, 2)
+
+    def test_overflow_closed_on_release(self):
+        pool = self.make_pool("pool-overflow", MAX_OVERFLOW=1)
+        first = pool.acquire(FakeConnection)
+        second = pool.acquire(FakeConnection)
+        pool.release(first)
+        pool.release(second)
+        self.assertTrue(second.closed)
+        self.assertEqual((pool.open, len(pool.idle)), (1, 1))
+
+    def test_pre_ping_replaces_broken_connection(self):
+        pool = self.make_pool("pool-ping")
+        broken = pool.acquire(FakeConnection)
+        pool.release(broken)
+        broken.closed = True
+        conn = pool.acquire(FakeConnection)
+        self.assertIsNot(conn, broken)
+        self.assertEqual(pool.open, 1)
+
+    def test_idle_connection_expires(self):
+        pool = self.make_pool("pool-idle", IDLE_TIMEOUT=0)
+        old = pool.acquire(FakeConnection)
+        pool.release(old)
+        self.assertIsNot(pool.acquire(FakeConnection), old)
+        self.assertTrue(old.closed)
+        self.assertEqual(pool.metrics.closes, 1)
+
+    def test_failed_connect_frees_slot(self):
+        pool = self.make_pool("pool-fail")
+
+        def fail():
+            raise OSError("refused")
+
+        with self.assertRaises(OSError):
+            pool.acquire(fail)
+        self.assertEqual(pool.open, 0)
+        pool.acquire(FakeConnection)
+
+    def test_metrics_rendered(self):
+        pool = self.make_pool("pool-metrics")
+        pool.acquire(FakeConnection)
+        body = registry.render()
+        self.assertIn('oms_db_pool_acquire_seconds_count{alias="pool-metrics"} 1', body)
+        self.assertIn(
+            'oms_db_pool_connections{alias="pool-metrics",state="open"} 1', body
+        )
+        self.assertIn('oms_db_pool_connects_total{alias="pool-metrics"} 1', body)
+
+
+class PooledBackendTestCase(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.connections = ConnectionHandler(
+            {
+                "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+                "pooled": {
+                    "ENGINE": "oms.db.sqlite3",
+                    "NAME": f"{tmp}/pooled.sqlite3",
+                    "POOL": {"SIZE": 1, "MAX_OVERFLOW": 0, "TIMEOUT": 0.1},
+                },
+            }
+        )
+        self.addCleanup(db_pool.close_all)
+
+    def test_close_returns_connection_to_pool(self):
+        conn = self.connections["pooled"]
+        conn.ensure_connection()
+        raw = conn.connection
+        conn.close()
+        conn.ensure_connection()
+        self.assertIs(conn.connection, raw)
+        conn.close()
+
+    def test_open_transaction_rolled_back(self):
+        conn = self.connections["pooled"]
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE TABLE t (id integer)")
+        conn.set_autocommit(False)
+        with conn.cursor() as cursor:
+            cursor.execute("INSERT INTO t VALUES (1)")
+        conn.close()
+        conn.ensure_connection()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM t")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        conn.close()
+
+    def test_pool_timeout_is_database_error(self):
+        conn = self.connections["pooled"]
+        conn.ensure_connection()
+        other = ConnectionHandler(self.connections.settings)["pooled"]
+        with self.assertRaises(OperationalError):
+            other.ensure_connection()
+        conn.close()
+
+
+class PostgreSQLPoolTestCase(SimpleTestCase):
+    """ping and reset of oms.db.postgresql against a mocked psycopg2 connection"""
+
+    def connection(self, status=extensions.TRANSACTION_STATUS_IDLE, error=None):
+        connection = mock.MagicMock(closed=0)
+        connection.get_transaction_status.return_value = status
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = error
+        return connection, cursor
+
+    def test_ping(self):
+        connection, cursor = self.connection()
+        self.assertTrue(postgresql.DatabaseWrapper.ping(connection))
+        cursor.execute.assert_called_once_with("SELECT 1")
+        connection.rollback.assert_not_called()
+
+        # the SELECT opened a transaction outside autocommit
+        connection, _ = self.connection(extensions.TRANSACTION_STATUS_INTRANS)
+        self.assertTrue(postgresql.DatabaseWrapper.ping(connection))
+        connection.rollback.assert_called_once()
+
+    def test_ping_fails(self):
+        connection, _ = self.connection(error=psycopg2.OperationalError("gone"))
+        self.assertFalse(postgresql.DatabaseWrapper.ping(connection))
+        connection, cursor = self.connection()
+        connection.closed = 1
+        self.assertFalse(postgresql.DatabaseWrapper.ping(connection))
+        cursor.execute.assert_not_called()
+
+    def test_reset_clears_session(self):
+        for transaction_status in (
+            extensions.TRANSACTION_STATUS_INTRANS,
+            extensions.TRANSACTION_STATUS_INERROR,
+        ):
+            connection, cursor = self.connection(transaction_status)
+            postgresql.DatabaseWrapper.reset(connection)
+            connection.rollback.assert_called_once()
+            self.assertIs(connection.autocommit, True)
+            cursor.execute.assert_called_once_with("DISCARD ALL")
+
+        connection, cursor = self.connection()
+        postgresql.DatabaseWrapper.reset(connection)
+        connection.rollback.assert_not_called()
+        cursor.execute.assert_called_once_with("DISCARD ALL")
+
+    def test_failed_reset_discards_connection(self):
+        pool = db_pool.Pool(
+            "pool-pg-reset",
+            ping=postgresql.DatabaseWrapper.ping,
+            reset=postgresql.DatabaseWrapper.reset,
+            options={"SIZE": 1, "MAX_OVERFLOW": 0, "TIMEOUT": 0.1},
+        )
+        for error in (None, psycopg2.OperationalError("gone")):
+            connection, _ = self.connection(error=error)
+            if error is None:
+                connection.closed = 1
+            self.assertIs(pool.acquire(lambda: connection), connection)
+            pool.release(connection)
+            connection.close.assert_called_once()
+            self.assertEqual((pool.open, len(pool.idle)), (0, 0))
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """
+    The replica is a second SQLite database, a copy of default made by sync().
+    It is added once the test databases are set up, the runner leaves it alone.
+    """
+
+    fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        connections.settings["replica"] = {
+            **connections.settings["default"],
+            "NAME": f"{cls.tmp}/replica.sqlite3",
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica"].close()
+        del connections.settings["replica"]
+        shutil.rmtree(cls.tmp)
+        super().tearDownClass()
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        cache.clear()
+        self.client = APIClient()
+        self.client.login(username="1111111111", password="admin")
+        self.sync()
+
+    def sync(self):
+        for alias in ("default", "replica"):
+            connections[alias].ensure_connection()
+        connections["default"].connection.backup(connections["replica"].connection)
+
+    def order_ids(self, url):
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return {order["id"] for order in res.json()["results"]}
+
+    def test_reads_served_by_replica(self):
+        listed = self.order_ids(reverse("order-list"))
+        order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        self.assertEqual(self.order_ids(reverse("order-list")), listed)
+        self.assertNotIn(order.id, self.order_ids(reverse("order-all")))
+        res = self.client.get(reverse("order-detail", args=(order.id,)))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(replicas.current_replica())
+
+        self.sync()
+        self.assertIn(order.id, self.order_ids(reverse("order-list")))
+
+    def test_item_list_served_by_replica(self):
+        Item.objects.create(name="saffron")
+        names = [
+            i["name"] for i in self.client.get(reverse("item-list")).json()["results"]
+        ]
+        self.assertNotIn("saffron", names)
+
+    def create_order(self):
+        data = {"items": [{"name": "rice", "quantity": 1, "unit": "kg"}]}
+        res = self.client.post(reverse("order-list"), data, format="json")
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res.json()["id"]
+
+    def test_user_reads_own_writes(self):
+        synced = self.create_order()
+        self.sync()
+        order_id = self.create_order()
+        self.assertIn(order_id, self.order_ids(reverse("order-list")))
+        res = self.client.get(reverse("order-detail", args=(order_id,)))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # other users, and this one once the pin lapses, read the replica
+        cache.delete(replicas.pin_key(1))
+        self.assertNotIn(order_id, self.order_ids(reverse("order-list")))
+        res = self.client.get(reverse("order-export"), {"format": "jsonl"})
+        lines = b"".join(res.streaming_content).splitlines()
+        exported = {json.loads(line)["order_id"] for line in lines}
+        self.assertEqual(exported, {synced})
+
+    @override_settings(DATABASE_REPLICA_PIN_SECONDS=0)
+    def test_no_pin_without_window(self):
+        order_id = self.create_order()
+        self.assertNotIn(order_id, self.order_ids(reverse("order-list")))
+
+    def test_writes_go_to_default(self):
+        replicas.read_from_replica(User.objects.get(pk=1))
+        self.addCleanup(replicas.read_from_primary)
+        self.assertEqual(router.db_for_read(Order), "replica")
+        self.assertEqual(router.db_for_write(Order), "default")
+        self.assertFalse(router.allow_migrate("replica", "api"))
+        cache_entry = DatabaseCache("oms_cache", {}).cache_model_class
+        self.assertEqual(router.db_for_read(cache_entry), "default")
+
+    def test_replica_reads_not_cached(self):
+        order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        self.sync()
+        # the item version moves on with the default database, the replica lags
+        Item.objects.create(name="saffron")
+        res = self.client.get(reverse("item-list"))
+        self.assertNotIn("saffron", [i["name"] for i in res.json()["results"]])
+        self.assertFalse(res.has_header("ETag"))
+        self.assertFalse(res.has_header("Last-Modified"))
+        res = self.client.get(reverse("order-detail", args=(order.id,)))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.has_header("ETag"))
+        self.assertFalse(self.client.get(reverse("order-list")).has_header("ETag"))
+
+        # reads from the default database are not served the replica's list
+        replicas.pin(1)
+        res = self.client.get(reverse("item-list"))
+        self.assertIn("saffron", [i["name"] for i in res.json()["results"]])
+        self.assertTrue(res.has_header("ETag"))
+
+
 class OrderItemTestCase(BaseTest):
     fixtures = ["fixtures/core.json"]
 
@@ -212,9 +1856,129 @@ class OrderItemTestCase(BaseTest):
         self.assertEqual(self.order.orderitem_set.count(), 0)
 
 
+class ReceiptTestCase(BaseTest):
+    fixtures = ["fixtures/core.json"]
+
+    def setUp(self) -> None:
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.order = Order.objects.create(customer_id=1, state=OrderState.CREATED)
+        OrderItem.objects.create(order=self.order, item_id=1, quantity=2, unit="kg")
+        self.url = reverse("order-receipt", args=(self.order.id,))
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        return super().tearDown()
+
+    def render_pending(self):
+        with mock.patch("api.receipts.pdfkit.from_string", return_value=b"%PDF-1.4"):
+            call_command("processreceipts", workers=1)
+
+    def test_receipt_is_queued(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(res.json()["url"].endswith(self.url))
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Receipt.objects.filter(order=self.order).count(), 1)
+
+    def test_receipt_served_from_cache(self):
+        self.client.get(self.url)
+        self.render_pending()
+        receipt = Receipt.objects.get(order=self.order)
+        self.assertEqual(receipt.state, ReceiptState.READY)
+        self.assertIn(f"receipts/{self.order.id}/", receipt.file.name)
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "application/pdf")
+        self.assertEqual(b"".join(res.streaming_content), b"%PDF-1.4")
+        res.close()
+
+    def test_receipt_rerendered_when_order_changes(self):
+        self.client.get(self.url)
+        self.render_pending()
+        OrderItem.objects.create(order=self.order, item_id=2, quantity=1, unit="kg")
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.render_pending()
+        # the older version is pruned once the new one is ready
+        self.assertEqual(Receipt.objects.filter(order=self.order).count(), 1)
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res.close()
+
+    def test_receipt_version_follows_printed_fields(self):
+        version = receipt_version(self.order)
+        # the customer is not printed on the receipt
+        Customer.objects.filter(pk=1).update(ship="Other ship")
+        self.assertEqual(receipt_version(self.order), version)
+
+        Item.objects.filter(pk=1).update(name="Basmati")
+        renamed = receipt_version(self.order)
+        self.assertNotEqual(renamed, version)
+        self.client.get(self.url)
+        self.render_pending()
+        self.assertEqual(Receipt.objects.get(order=self.order).version, renamed)
+
+        template = mock.Mock(render=lambda context: "GSTIN changed")
+        with mock.patch("api.receipts.loader.get_template", return_value=template):
+            self.assertNotEqual(receipt_version(self.order), renamed)
+
+
 class ItemTestCase(BaseTest):
     fixtures = ["fixtures/core.json", "fixtures/customer3.json"]
 
+    def test_item_list_cached_until_items_change(self):
+        url = reverse("item-list")
+        res = self.client.get(url)
+        etag = res["ETag"]
+        self.assertIn("Last-Modified", res)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+        self.assertEqual(res["ETag"], etag)
+        self.assertNotIn("api_item", " ".join(q["sql"] for q in ctx.captured_queries))
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.patch(reverse("item-detail", args=(1,)), {"name": "Basmati"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("Basmati", [i["name"] for i in res.json()["results"]])
+
+    def test_item_list_sees_items_created_by_orders(self):
+        url = reverse("item-list")
+        count = self.client.get(url).json()["count"]
+        data = {"items": [{"name": "saffron", "quantity": 1, "unit": "g"}]}
+        self.client.post(reverse("order-list"), data)
+        self.assertEqual(self.client.get(url).json()["count"], count + 1)
+
+    def test_customer_detail_cached_until_customer_changes(self):
+        url = reverse("customer-detail", args=(1,))
+        res = self.client.get(url)
+        etag = res["ETag"]
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.patch(url, {"ship": "Ship9"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["ship"], "Ship9")
+
+    def test_versions_expire_only_in_local_cache(self):
+        self.assertIsNone(versions.version_timeout())
+        backend = "django.core.cache.backends.locmem.LocMemCache"
+        locmem = {"default": {"BACKEND": backend}}
+        with override_settings(CACHES=locmem, LOCAL_CACHE_VERSION_TIMEOUT=5):
+            self.assertEqual(versions.version_timeout(), 5)
+
     def test_item_list_admin_can_access(self):
         url = reverse("item-list")
         res = self.client.get(url)
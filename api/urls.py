@@ -17,4 +17,15 @@ urlpatterns = [
     path("", include(router.urls)),
     path("auth/", include("rest_framework.urls", namespace="rest_framework")),
     path("api-auth/", views.CustomAuthToken.as_view()),
+    path(
+        "order/events/ticket/", views.EventsTicketView.as_view(), name="events-ticket"
+    ),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
+    path("import/<str:kind>/", views.ImportView.as_view(), name="import"),
+    path(
+        "report/customers/",
+        views.CustomerSalesReportView.as_view(),
+        name="report-customers",
+    ),
+    path("report/items/", views.ItemSalesReportView.as_view(), name="report-items"),
 ]
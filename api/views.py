@@ -1,17 +1,44 @@
-from decimal import Decimal
+import hashlib
+import os
 import logging
-from django.http import FileResponse
-from django.template import loader
-import pdfkit
-import tempfile
 
-from rest_framework import mixins, permissions, viewsets
+from django.conf import settings
+from django.db.models import Count, DateField, Max, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.fields import DecimalField
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from api.models import Customer, Item, Order, OrderItem
+from oms import metrics, replicas
+from api import cache, exports, imports, stream
+from api.authentication import token_expired, token_expires_on
+from api.models import (
+    Customer,
+    DailyCustomerSales,
+    DailyItemSales,
+    Item,
+    Order,
+    OrderItem,
+    ReceiptState,
+)
+from api.pagination import OrderPagination
+from api.receipts import get_or_queue_receipt
+from api.renderers import CSVRenderer, JSONLinesRenderer
+from api.roles import get_customer_id, get_roles, is_admin
 from api.serializers import (
     CreateCustomerSerializer,
     CreateOrderItemSerializer,
@@ -19,56 +46,111 @@ from api.serializers import (
     ItemSerializer,
     OrderCreateSerializer,
     OrderDetailSerializer,
+    OrderItemPriceSerializer,
+    OrderListRows,
     OrderListSerializer,
     OrderSerializer,
+    OrderTotalSerializer,
+    ReportQuerySerializer,
     UpdateOrderItemSerializer,
+    sparse_params,
 )
+from api.streaming import StreamingJSONResponse, stream_rows
+
+
+def latest(*timestamps):
+    """The most recent of the timestamps that are set"""
+    return max((t for t in timestamps if t is not None), default=None)
+
+
+def conditional_response(request, validators, last_modified, respond):
+    """
+    Answer 304 when the client already holds what the validators describe,
+    otherwise build the response with respond() and attach the validators
+    """
+    digest = hashlib.md5("|".join(str(v) for v in validators).encode("utf-8"))
+    etag = quote_etag(digest.hexdigest())
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = (
+        get_conditional_response(request, etag=etag, last_modified=timestamp)
+        or respond()
+    )
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+class ReplicaReadMixin:
+    """
+    Reads of the safe requests to the actions in replica_actions go to a read
+    replica, once the user is authenticated and allowed in, see oms.replicas.
+
+    The cache versions follow the default database and a replica may not have
+    caught up with them yet, so responses read from a replica are neither
+    cached nor given validators built from the versions.
+    """
+
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            self.action in self.replica_actions
+            and request.method in permissions.SAFE_METHODS
+        ):
+            replicas.read_from_replica(request.user)
 
 
 class CustomAuthToken(ObtainAuthToken):
+    # credentials come in the body, a stale token header must not block a new login
+    authentication_classes = ()
+
     def post(self, request, *args, **kwargs):
-        logging.info(request.data)
         serializer = self.serializer_class(
             data=request.data, context={"request": request}
         )
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data["user"]
-        token, _ = Token.objects.get_or_create(user=user)
-        roles = [g.name for g in user.groups.all()]
+        token, created = Token.objects.get_or_create(user=user)
+        rotate = str(request.data.get("rotate", "")).lower() in ("1", "true")
+        if not created and (rotate or token_expired(token.created)):
+            # deleting the old key also drops it from the token cache
+            token.delete()
+            token = Token.objects.create(user=user)
+        expires_on = token_expires_on(token.created)
         return Response(
             {
                 "token": token.key,
+                "expires_on": expires_on.isoformat() if expires_on else None,
                 "user_id": user.pk,
                 "customer_id": user.customer.id,
-                "roles": roles,
+                "roles": sorted(get_roles(user)),
             }
         )
 
 
 class IsOrderOwnerOrAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        if view.action == "all":
-            return request.user.groups.filter(name="admin").exists()
+        if view.action in ("all", "export"):
+            return is_admin(request.user)
         return True
 
     def has_object_permission(self, request, view, obj):
-        customer = getattr(request.user, "customer", None)
-        return (
-            obj.customer == customer
-            or request.user.groups.filter(name="admin").exists()
+        return obj.customer_id == get_customer_id(request.user) or is_admin(
+            request.user
         )
 
 
 class IsOrderItemOwnerOrAdmin(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        customer = getattr(request.user, "customer", None)
-        return (
-            obj.order.customer == customer
-            or request.user.groups.filter(name="admin").exists()
+        return obj.order.customer_id == get_customer_id(request.user) or is_admin(
+            request.user
         )
 
 
 class OrderViewSet(
+    ReplicaReadMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -78,6 +160,13 @@ class OrderViewSet(
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated, IsOrderOwnerOrAdmin]
+    pagination_class = OrderPagination
+    replica_actions = ("list", "all", "retrieve", "export")
+    filterset_fields = {
+        "state": ["exact"],
+        "customer": ["exact"],
+        "created_on": ["gte", "lt"],
+    }
 
     def get_serializer_class(self):
         if self.action in ("list", "all"):
@@ -87,22 +176,136 @@ class OrderViewSet(
         return OrderDetailSerializer
 
     def get_queryset(self):
-        if self.action == "all":
-            return Order.objects.all().order_by("-created_on")
-        user = self.request.user
+        queryset = self.get_base_queryset()
+        if self.action in ("list", "all"):
+            return self.get_list_queryset(queryset)
+        if self.action in ("retrieve", "update", "partial_update"):
+            # OrderDetailSerializer reads the customer and every line's item
+            return queryset.with_lines()
+        return queryset.order_by("-created_on")
+
+    def get_base_queryset(self):
         if self.action == "list":
-            try:
-                customer = Customer.objects.get(user=user)
-            except Customer.DoesNotExist:
+            customer_id = get_customer_id(self.request.user)
+            if customer_id is None:
                 return Order.objects.none()
-            else:
-                return Order.objects.filter(customer=customer).order_by("-created_on")
-        return Order.objects.order_by("-created_on")
+            return Order.objects.filter(customer_id=customer_id)
+        return Order.objects.all()
+
+    def get_list_queryset(self, queryset):
+        # everything OrderListSerializer reads is joined or annotated here,
+        # so a page costs the same number of queries whatever its size
+        return (
+            queryset.select_related("customer__user")
+            .annotate(item_count=Count("orderitem"))
+            .order_by("-created_on", "-id")
+        )
+
+    def list(self, request, *args, **kwargs):
+        if replicas.current_replica():
+            return self.build_list(request, *args, **kwargs)
+        validators, last_updated = self.list_validators(request)
+        return conditional_response(
+            request,
+            validators,
+            last_updated,
+            lambda: self.build_list(request, *args, **kwargs),
+        )
+
+    def list_validators(self, request):
+        queryset = self.filter_queryset(self.get_base_queryset())
+        last_updated = queryset.aggregate(last_updated=Max("updated_on"))[
+            "last_updated"
+        ]
+        # deletions and customer profile edits leave updated_on alone
+        orders_changed = cache.last_modified(cache.ORDERS)
+        customers_changed = cache.last_modified(cache.CUSTOMERS)
+        validators = [
+            request.user.pk,
+            request.get_full_path(),
+            last_updated,
+            orders_changed,
+            customers_changed,
+        ]
+        return validators, latest(last_updated, orders_changed, customers_changed)
+
+    def build_list(self, request, *args, **kwargs):
+        sparse = sparse_params(request)
+        if sparse is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            format_rows = self.serialize_page
+        else:
+            # sparse lists skip the serializer and format plain .values() rows
+            rows = OrderListRows(*sparse)
+            queryset = self.filter_queryset(self.get_base_queryset())
+            queryset = rows.values(queryset.order_by("-created_on", "-id"))
+            format_rows = rows.format
+
+        renderer = request.accepted_renderer
+        if renderer.format == "json" and self.paginator.streams(request):
+            page = self.paginator.paginate_stream(queryset, request)
+            results = stream_rows(page, format_rows, renderer)
+            return StreamingJSONResponse(
+                self.paginator.get_stream_parts(results), renderer
+            )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(format_rows(page))
+        return Response(format_rows(queryset))
+
+    def serialize_page(self, page):
+        return self.get_serializer(page, many=True).data
+
+    def retrieve(self, request, *args, **kwargs):
+        if replicas.current_replica():
+            return super().retrieve(request, *args, **kwargs)
+        validators, updated_on = self.retrieve_validators(request, kwargs["pk"])
+        return conditional_response(
+            request,
+            validators,
+            updated_on,
+            lambda: super(OrderViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
+    def retrieve_validators(self, request, pk):
+        order = get_object_or_404(
+            Order.objects.only("id", "customer_id", "updated_on"), pk=pk
+        )
+        self.check_object_permissions(request, order)
+        customer_changed = cache.last_modified(
+            cache.customer_namespace(order.customer_id)
+        )
+        items_changed = cache.last_modified(cache.ITEMS)
+        # ?fields= and the other query variants are representations of their own
+        validators = [
+            request.get_full_path(),
+            order.id,
+            order.updated_on,
+            customer_changed,
+            items_changed,
+        ]
+        return validators, latest(order.updated_on, customer_changed, items_changed)
 
     @action(detail=False, methods=["get"])
     def all(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
 
-        return self.list(self, request, *args, **kwargs)
+    @action(
+        detail=False,
+        methods=["get"],
+        renderer_classes=[CSVRenderer, JSONLinesRenderer],
+    )
+    def export(self, request):
+        """Every matching order with its lines, `?format=csv` or `?format=jsonl`"""
+        rows = exports.export_rows(self.filter_queryset(self.get_base_queryset()))
+        renderer = request.accepted_renderer
+        lines = exports.csv_lines if renderer.format == "csv" else exports.jsonl_lines
+        filename = f"orders-{timezone.now():%Y%m%d%H%M%S}.{renderer.format}"
+        return StreamingHttpResponse(
+            lines(rows),
+            content_type=f"{renderer.media_type}; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
 
     @action(detail=True, methods=["post"])
     def add_item(self, request, pk):
@@ -113,34 +316,29 @@ class OrderViewSet(
             serializer.create(serializer.validated_data)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["post"])
+    def prices(self, request, pk):
+        order = self.get_object()
+        serializer = OrderItemPriceSerializer(order, data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({**OrderTotalSerializer(order).data, "items": serializer.data})
+
     @action(detail=True, methods=["get"])
     def receipt(self, request, pk):
         order = self.get_object()
-        serializer = OrderDetailSerializer(instance=order)
-        context = serializer.data
-        for item in context["items"]:
-            logging.info(item)
-            if item["price"]:
-                item["total"] = Decimal(
-                    Decimal(item["price"]) * Decimal(item["quantity"])
-                )
-            else:
-                item["total"] = ""
-        template = loader.get_template("api/receipt.html")
-        html_content = template.render(context, request)
-        # TODO: change receipt_filename to some media location
-        receipt_filename = f"order_{order.id}.pdf"
-        html_file = tempfile.NamedTemporaryFile("w", suffix=".html")
-        html_file.write(html_content)
-        html_file.flush()
-        logging.info(html_file.name)
-        pdfkit.from_file(html_file.name, receipt_filename)
-        html_file.close()
-
-        response = FileResponse(
-            open(receipt_filename, "rb"), content_type="application/pdf"
+        receipt = get_or_queue_receipt(order)
+        if receipt.state == ReceiptState.READY:
+            return FileResponse(receipt.file.open("rb"), content_type="application/pdf")
+        response = Response(
+            {
+                "state": ReceiptState.values[receipt.state],
+                "url": request.build_absolute_uri(),
+            },
+            status=status.HTTP_202_ACCEPTED,
         )
-        # response["Content-Disposition"] = f'attachment; filename="{receipt_filename}"'
+        response["Location"] = request.build_absolute_uri()
+        response["Retry-After"] = settings.RECEIPT_POLL_INTERVAL
         return response
 
     def get_serializer_context(self):
@@ -148,9 +346,19 @@ class OrderViewSet(
         context["user"] = self.request.user
         return context
 
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop("partial", False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        # UpdateModelMixin would drop the prefetched lines here and reload them
+        # one item at a time, nested writes are refused so they are still current
+        return Response(serializer.data)
+
     def partial_update(self, request, *args, **kwargs):
-        logging.info(f"{args}, {kwargs}")
-        logging.info(request.data)
+        logging.debug(f"{args}, {kwargs}")
+        logging.debug(request.data)
         return super().partial_update(request, *args, **kwargs)
 
 
@@ -160,11 +368,19 @@ class OrderItemViewSet(
     mixins.DestroyModelMixin,
     viewsets.GenericViewSet,
 ):
-    queryset = OrderItem.objects.all()
+    queryset = OrderItem.objects.select_related("order")
     serializer_class = UpdateOrderItemSerializer
     permission_classes = [permissions.IsAuthenticated, IsOrderItemOwnerOrAdmin]
 
 
+def customer_etag(request, pk):
+    return cache.etag(cache.customer_namespace(pk), request.get_full_path())
+
+
+def customer_last_modified(request, pk):
+    return cache.last_modified(cache.customer_namespace(pk))
+
+
 class CustomerViewSet(
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
@@ -185,13 +401,148 @@ class CustomerViewSet(
             return CreateCustomerSerializer
         return DetailCustomerSerializer
 
+    @method_decorator(
+        condition(etag_func=customer_etag, last_modified_func=customer_last_modified)
+    )
+    def retrieve(self, request, *args, **kwargs):
+        # profiles carry no object level permission, so a cache hit skips the lookup
+        def build():
+            return super(CustomerViewSet, self).retrieve(request, *args, **kwargs).data
+
+        namespace = cache.customer_namespace(kwargs["pk"])
+        path = request.get_full_path()
+        return Response(cache.get_or_build(namespace, [path], build))
+
 
 class IsAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="admin").exists()
+        return is_admin(request.user)
+
+
+class EventsTicketView(APIView):
+    """One-time ticket for opening the order event stream, see api.stream"""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return Response(
+            {
+                "ticket": stream.issue_ticket(request.user),
+                "expires_in": settings.EVENTS_TICKET_SECONDS,
+            }
+        )
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.registry.render(), content_type="text/plain; version=0.0.4"
+        )
+
+
+class ImportView(APIView):
+    """POST a CSV or JSON Lines `file` of items or orders, see api.imports"""
+
+    permission_classes = [IsAdmin]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, kind):
+        if kind not in imports.IMPORTERS:
+            raise NotFound(f"Nothing to import as {kind}")
+        upload = request.data.get("file")
+        if upload is None:
+            raise ValidationError({"file": ["This field is required."]})
+        file_format = os.path.splitext(upload.name)[1][1:]
+        if file_format not in ("csv", "jsonl"):
+            raise ValidationError({"file": ["Expected a .csv or .jsonl file"]})
+        result = imports.import_file(upload, file_format, kind)
+        return Response(result.as_dict())
+
+
+class SalesReportView(APIView):
+    """
+    Time series of delivered sales from the daily rollups, filtered by
+    `start`/`end` (inclusive dates) and the ids in `filters`, bucketed by `interval`
+    """
+
+    permission_classes = [IsAdmin]
+    model = None
+    group_by = ()
+    filters = ()
+    truncate = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+    money = DecimalField(max_digits=30, decimal_places=2)
+
+    def get(self, request):
+        params = ReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        unsupported = ({"customer", "item"} - set(self.filters)) & set(query)
+        if unsupported:
+            raise ValidationError(
+                {name: "Not a filter of this report" for name in sorted(unsupported)}
+            )
+        rollups = self.model.objects.all()
+        if "start" in query:
+            rollups = rollups.filter(day__gte=query["start"])
+        if "end" in query:
+            rollups = rollups.filter(day__lte=query["end"])
+        for name in self.filters:
+            if name in query:
+                rollups = rollups.filter(**{f"{name}_id": query[name]})
+        period = self.truncate[query["interval"]]("day", output_field=DateField())
+        series = (
+            rollups.annotate(period=period)
+            .values("period", *self.group_by)
+            .annotate(**self.get_sums())
+            .order_by("period", *self.group_by)
+        )
+        series = list(series)
+        for row in series:
+            row["revenue"] = self.money.to_representation(row["revenue"])
+        return Response({"interval": query["interval"], "series": series})
+
+
+class CustomerSalesReportView(SalesReportView):
+    """Orders, lines and revenue per period, of one customer or of everyone"""
+
+    model = DailyCustomerSales
+    filters = ("customer",)
+
+    def get_sums(self):
+        return {
+            "orders": Sum("orders"),
+            "lines": Sum("lines"),
+            "revenue": Sum("revenue"),
+        }
+
+
+class ItemSalesReportView(SalesReportView):
+    """Quantity and revenue per period of each item and unit"""
+
+    model = DailyItemSales
+    group_by = ("item_id", "item__name", "unit")
+    filters = ("customer", "item")
+
+    def get_sums(self):
+        return {
+            "quantity": Sum("quantity"),
+            "lines": Sum("lines"),
+            "revenue": Sum("revenue"),
+        }
+
+
+def items_etag(request):
+    return cache.etag(cache.ITEMS, request.get_full_path())
+
+
+def items_last_modified(request):
+    return cache.last_modified(cache.ITEMS)
 
 
 class ItemsViewSet(
+    ReplicaReadMixin,
     mixins.UpdateModelMixin,
     mixins.ListModelMixin,
     viewsets.GenericViewSet,
@@ -199,3 +550,19 @@ class ItemsViewSet(
     queryset = Item.objects.all()
     serializer_class = ItemSerializer
     permission_classes = [IsAdmin]
+    replica_actions = ("list",)
+
+    def list(self, request, *args, **kwargs):
+        if replicas.current_replica():
+            return super().list(request, *args, **kwargs)
+        return self.cached_list(request, *args, **kwargs)
+
+    @method_decorator(
+        condition(etag_func=items_etag, last_modified_func=items_last_modified)
+    )
+    def cached_list(self, request, *args, **kwargs):
+        def build():
+            return super(ItemsViewSet, self).list(request, *args, **kwargs).data
+
+        path = request.get_full_path()
+        return Response(cache.get_or_build(cache.ITEMS, [path], build))
@@ -0,0 +1,23 @@
+"""
+gunicorn settings, read from the working directory. SERVER_MODE=asgi serves
+oms.asgi from uvicorn workers, where slow clients cost the worker a socket
+rather than the whole process, the default wsgi keeps sync workers.
+
+The order event stream (/order/events/) is only served in asgi mode, and its
+events are handed over in process memory, see api.events: a client sees the
+changes made through the worker it is connected to, never those of other
+workers, containers or management commands (importdata, repriceorders...).
+asgi mode therefore runs a single worker, which is also the one writing.
+"""
+import os
+
+SERVER_MODES = {
+    "wsgi": ("oms.wsgi:application", "sync"),
+    "asgi": ("oms.asgi:application", "uvicorn.workers.UvicornWorker"),
+}
+
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+wsgi_app, worker_class = SERVER_MODES[SERVER_MODE]
+if SERVER_MODE == "asgi":
+    # more workers would each stream only their own share of the writes
+    workers = 1
@@ -2,6 +2,8 @@
 ASGI config for oms project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with uvicorn workers, see gunicorn.conf.py. The order event stream is
+served here directly, every other path by Django's own ASGI handler.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
@@ -12,5 +14,16 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "oms.settings")
+# every request runs in a thread of its own, a connection kept open past the
+# request would never be reused
+os.environ.setdefault("DATABASE_CONN_MAX_AGE", "0")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api import stream  # noqa: E402, needs the app registry loaded above
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == stream.PATH:
+        return await stream.order_events(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,109 @@
+"""
+Compression of API responses, brotli when the client accepts it and gzip
+otherwise. Unlike django's GZipMiddleware the size threshold is configurable
+and only the content types in COMPRESS_CONTENT_TYPES are touched, statics are
+left to whitenoise which serves them precompressed.
+"""
+import re
+
+import brotli
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+ACCEPT_ENCODING = re.compile(r"\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?")
+
+
+def accepted_encodings(header):
+    """Encodings of an Accept-Encoding header the client did not refuse with q=0"""
+    accepted = set()
+    for part in header.split(","):
+        match = ACCEPT_ENCODING.match(part)
+        if not match:
+            continue
+        name, quality = match.group(1).lower(), match.group(2)
+        try:
+            if quality is not None and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name)
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    for encoding in settings.COMPRESS_ENCODINGS:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+def brotli_compress_sequence(sequence):
+    compressor = brotli.Compressor(quality=settings.COMPRESS_BROTLI_QUALITY)
+    pending = 0
+    for item in sequence:
+        chunk = compressor.process(item)
+        pending += len(item)
+        # a flush ends the block, per row of an export it cost most of the ratio,
+        # every COMPRESS_FLUSH_SIZE bytes a slow stream still arrives piecewise
+        if pending >= settings.COMPRESS_FLUSH_SIZE:
+            chunk += compressor.flush()
+            pending = 0
+        if chunk:
+            yield chunk
+    yield compressor.finish()
+
+
+def compress_body(encoding, content):
+    if encoding == "br":
+        return brotli.compress(content, quality=settings.COMPRESS_BROTLI_QUALITY)
+    return compress_string(content)
+
+
+def compress_stream(encoding, sequence):
+    if encoding == "br":
+        return brotli_compress_sequence(sequence)
+    return compress_sequence(sequence)
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.compressible(response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(
+                encoding, response.streaming_content
+            )
+            del response["Content-Length"]
+        else:
+            if len(response.content) < settings.COMPRESS_MIN_SIZE:
+                return response
+            compressed = compress_body(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # the body changed, a strong ETag would no longer match it byte for byte
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+    def compressible(self, response):
+        if response.has_header("Content-Encoding") or response.status_code == 304:
+            return False
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        return content_type in settings.COMPRESS_CONTENT_TYPES
@@ -0,0 +1,210 @@
+"""
+Per process pools of database connections, used by the backends in
+oms.db.postgresql and oms.db.sqlite3. Django gives its connection back when it
+closes it, which it does at the end of every request with CONN_MAX_AGE=0, and
+takes one when it next connects, so the threads of a worker share at most
+SIZE + MAX_OVERFLOW connections rather than holding one each. Connections idle
+longer than IDLE_TIMEOUT are closed, and with PRE_PING every connection is
+tested before it is handed out, so a restarted database costs a reconnect
+rather than failed requests.
+"""
+from collections import deque
+from functools import partial
+import threading
+from time import monotonic, perf_counter
+
+from django.utils.asyncio import async_unsafe
+
+from oms.metrics import registry
+
+DEFAULTS = {
+    "SIZE": 5,
+    "MAX_OVERFLOW": 10,
+    "TIMEOUT": 30,
+    "IDLE_TIMEOUT": 300,
+    "PRE_PING": True,
+}
+
+# (alias, database name) -> Pool
+pools = {}
+_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Pool:
+    def __init__(self, alias, ping, reset, options=None):
+        options = {**DEFAULTS, **(options or {})}
+        self.alias = alias
+        self.ping = ping
+        self.reset = reset
+        self.size = options["SIZE"]
+        self.max_overflow = options["MAX_OVERFLOW"]
+        self.timeout = options["TIMEOUT"]
+        self.idle_timeout = options["IDLE_TIMEOUT"]
+        self.pre_ping = options["PRE_PING"]
+        # (connection, returned at), the most recently returned on the right
+        self.idle = deque()
+        self.open = 0
+        self.condition = threading.Condition()
+        self.metrics = registry.pool(alias)
+
+    def acquire(self, connect):
+        """An idle connection, or a new one from connect() while under the limit"""
+        started = perf_counter()
+        deadline = monotonic() + self.timeout
+        while True:
+            connection, expired = self.checkout(deadline)
+            for stale in expired:
+                self.close(stale)
+            if connection is None:
+                connection = self.create(connect)
+                break
+            if not self.pre_ping or self.ping(connection):
+                break
+            self.discard(connection)
+        self.metrics.acquired(perf_counter() - started)
+        return connection
+
+    def checkout(self, deadline):
+        """
+        An idle connection and those found expired, the connection is None
+        when a new one may be opened. Waits for a release at the limit.
+        """
+        expired = []
+        with self.condition:
+            while True:
+                now = monotonic()
+                while self.idle and now - self.idle[0][1] > self.idle_timeout:
+                    expired.append(self.idle.popleft()[0])
+                    self.open -= 1
+                if self.idle:
+                    connection = self.idle.pop()[0]
+                    break
+                if self.open < self.size + self.max_overflow:
+                    self.open += 1
+                    connection = None
+                    break
+                if now >= deadline:
+                    self.metrics.count("timeouts")
+                    raise PoolTimeout(
+                        f"No connection to {self.alias} free after {self.timeout}s, "
+                        f"all {self.open} are in use"
+                    )
+                self.condition.wait(deadline - now)
+            self.update_gauges()
+        return connection, expired
+
+    def create(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.open -= 1
+                self.update_gauges()
+                self.condition.notify()
+            raise
+        self.metrics.count("connects")
+        return connection
+
+    def release(self, connection):
+        try:
+            self.reset(connection)
+        except Exception:
+            self.discard(connection)
+            return
+        with self.condition:
+            # connections over SIZE only live as long as they are in use
+            if len(self.idle) < self.size:
+                self.idle.append((connection, monotonic()))
+                self.update_gauges()
+                self.condition.notify()
+                return
+        self.discard(connection)
+
+    def discard(self, connection):
+        with self.condition:
+            self.open -= 1
+            self.update_gauges()
+            self.condition.notify()
+        self.close(connection)
+
+    def close(self, connection):
+        self.metrics.count("closes")
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_idle(self):
+        with self.condition:
+            idle = [connection for connection, _ in self.idle]
+            self.idle.clear()
+            self.open -= len(idle)
+            self.update_gauges()
+            self.condition.notify_all()
+        for connection in idle:
+            self.close(connection)
+
+    def update_gauges(self):
+        self.metrics.open = self.open
+        self.metrics.idle = len(self.idle)
+
+
+def get_pool(alias, name, options, ping, reset):
+    key = (alias, name)
+    with _lock:
+        pool = pools.get(key)
+        if pool is None:
+            pool = pools[key] = Pool(alias, ping, reset, options)
+        return pool
+
+
+def close_all():
+    with _lock:
+        for pool in pools.values():
+            pool.close_idle()
+
+
+class PooledDatabaseWrapper:
+    """
+    Mixin for a backend's DatabaseWrapper, taking connections from the pool
+    configured by the POOL entry of the database settings. Backends provide
+    ping(connection), telling if it still works, and reset(connection),
+    readying it for reuse or raising if it can't be.
+    """
+
+    @property
+    def pooled(self):
+        return True
+
+    def get_pool(self):
+        return get_pool(
+            self.alias,
+            self.settings_dict["NAME"],
+            self.settings_dict.get("POOL"),
+            self.ping,
+            self.reset,
+        )
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        connect = partial(super().get_new_connection, conn_params)
+        if not self.pooled:
+            return connect()
+        try:
+            return self.get_pool().acquire(connect)
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if not self.pooled:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps using the connection until the block exits
+                self.get_pool().discard(self.connection)
+            else:
+                self.get_pool().release(self.connection)
@@ -0,0 +1,36 @@
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from oms.db.pool import PooledDatabaseWrapper
+
+
+class DatabaseWrapper(PooledDatabaseWrapper, base.DatabaseWrapper):
+    @staticmethod
+    def ping(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if (
+                connection.get_transaction_status()
+                != extensions.TRANSACTION_STATUS_IDLE
+            ):
+                connection.rollback()
+        except base.Database.Error:
+            return False
+        return True
+
+    @staticmethod
+    def reset(connection):
+        if connection.closed:
+            raise base.Database.InterfaceError("connection already closed")
+        if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        # SET, temporary tables, prepared statements, advisory locks and LISTEN
+        # stay with the session, the next user gets a clean one. DISCARD ALL
+        # can't run in a transaction, connect() restores Django's autocommit
+        # and time zone when the connection is handed out again.
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute("DISCARD ALL")
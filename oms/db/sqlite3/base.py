@@ -0,0 +1,23 @@
+from django.db.backends.sqlite3 import base
+
+from oms.db.pool import PooledDatabaseWrapper
+
+
+class DatabaseWrapper(PooledDatabaseWrapper, base.DatabaseWrapper):
+    @property
+    def pooled(self):
+        # every connection to an in-memory database is a database of its own
+        return not self.is_in_memory_db()
+
+    @staticmethod
+    def ping(connection):
+        try:
+            connection.execute("SELECT 1")
+        except base.Database.Error:
+            return False
+        return True
+
+    @staticmethod
+    def reset(connection):
+        if connection.in_transaction:
+            connection.rollback()
@@ -0,0 +1,359 @@
+"""
+Per-view request metrics collected by MetricsMiddleware and exposed in the
+Prometheus text format. Metrics live in the memory of the worker process, so
+every gunicorn worker reports its own numbers. Database connection pools, see
+oms.db.pool, report theirs alongside.
+
+A streamed response is measured until it is closed, its size, queries and
+serializer time include the work done while the body was sent.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+import logging
+import threading
+from time import perf_counter
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+# the measurement of the request being served, same scope as django.db.connections
+_state = Local()
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.db_seconds = 0
+        self.serializer_seconds = 0
+        self.render_seconds = 0
+        self.statuses = defaultdict(int)
+
+
+class PoolMetrics:
+    """Connection pool numbers, updated by oms.db.pool"""
+
+    def __init__(self):
+        self.wait = Histogram(WAIT_BUCKETS)
+        self.connects = 0
+        self.closes = 0
+        self.timeouts = 0
+        self.open = 0
+        self.idle = 0
+        self.lock = threading.Lock()
+
+    def acquired(self, seconds):
+        with self.lock:
+            self.wait.observe(seconds)
+
+    def count(self, attr):
+        with self.lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+
+class Registry:
+    metrics = (
+        ("duration", "oms_request_duration_seconds", "Request latency"),
+        ("queries", "oms_request_db_queries", "Database queries per request"),
+        ("response_size", "oms_response_size_bytes", "Response body size"),
+    )
+    counters = (
+        ("db_seconds", "oms_request_db_seconds_total", "Time spent in the database"),
+        (
+            "serializer_seconds",
+            "oms_request_serializer_seconds_total",
+            "Time spent in serializers turning objects into data",
+        ),
+        (
+            "render_seconds",
+            "oms_request_render_seconds_total",
+            "Time spent rendering serialized data into the response body",
+        ),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+        self.pools = defaultdict(PoolMetrics)
+
+    def record(self, sample):
+        key = (sample.view, sample.method)
+        with self.lock:
+            view = self.views[key]
+            view.duration.observe(sample.duration)
+            view.queries.observe(sample.query_count)
+            view.response_size.observe(sample.response_size)
+            view.db_seconds += sample.db_time
+            view.serializer_seconds += sample.serializer_time
+            view.render_seconds += sample.render_time
+            view.statuses[sample.status] += 1
+
+    def pool(self, alias):
+        with self.lock:
+            return self.pools[alias]
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                "# HELP oms_requests_total Requests served",
+                "# TYPE oms_requests_total counter",
+            ]
+            for (view, method), metrics in views:
+                for status, count in sorted(metrics.statuses.items()):
+                    labels = f'view="{view}",method="{method}",status="{status}"'
+                    lines.append(f"oms_requests_total{{{labels}}} {count}")
+            for attr, name, description in self.metrics:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for (view, method), metrics in views:
+                    labels = f'view="{view}",method="{method}"'
+                    lines.extend(getattr(metrics, attr).lines(name, labels))
+            for attr, name, description in self.counters:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} counter")
+                for (view, method), metrics in views:
+                    labels = f'view="{view}",method="{method}"'
+                    lines.append(f"{name}{{{labels}}} {getattr(metrics, attr)}")
+            lines.extend(self.render_pools())
+        return "\n".join(lines) + "\n"
+
+    def render_pools(self):
+        pools = sorted(self.pools.items())
+        if not pools:
+            return []
+        name = "oms_db_pool_acquire_seconds"
+        lines = [
+            f"# HELP {name} Time spent waiting for a pooled database connection",
+            f"# TYPE {name} histogram",
+        ]
+        for alias, metrics in pools:
+            with metrics.lock:
+                lines.extend(metrics.wait.lines(name, f'alias="{alias}"'))
+        lines += [
+            "# HELP oms_db_pool_connections Pooled database connections",
+            "# TYPE oms_db_pool_connections gauge",
+        ]
+        for alias, metrics in pools:
+            lines.append(
+                f'oms_db_pool_connections{{alias="{alias}",state="open"}} {metrics.open}'
+            )
+            lines.append(
+                f'oms_db_pool_connections{{alias="{alias}",state="idle"}} {metrics.idle}'
+            )
+        for attr, description in (
+            ("connects", "Connections opened"),
+            ("closes", "Connections closed, idle, broken or over the pool size"),
+            ("timeouts", "Requests that gave up waiting for a connection"),
+        ):
+            name = f"oms_db_pool_{attr}_total"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for alias, metrics in pools:
+                lines.append(f'{name}{{alias="{alias}"}} {getattr(metrics, attr)}')
+        return lines
+
+
+registry = Registry()
+
+
+class QueryCapture:
+    """Database execute wrapper counting and timing queries of one request"""
+
+    def __init__(self, max_captured):
+        self.max_captured = max_captured
+        self.count = 0
+        self.time = 0
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - start
+            self.count += 1
+            self.time += elapsed
+            if len(self.captured) < self.max_captured:
+                self.captured.append((elapsed, sql))
+
+
+class Measurement:
+    """What one request costs, from the view to the last byte of its body"""
+
+    def __init__(self, request):
+        self.request = request
+        self.capture = QueryCapture(settings.SLOW_REQUEST_MAX_QUERIES_LOGGED)
+        self.start = perf_counter()
+        self.serializer_time = 0
+        self.render_time = 0
+
+    @contextmanager
+    def tracking(self):
+        """Count the queries and serializer time of the code run in the block"""
+        previous = getattr(_state, "measurement", None)
+        _state.measurement = self
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(self.capture)
+                    )
+                yield
+        finally:
+            _state.measurement = previous
+
+    def finish(self, response, response_size):
+        sample = Sample(
+            self.request,
+            response,
+            perf_counter() - self.start,
+            self,
+            response_size,
+        )
+        registry.record(sample)
+        if (
+            sample.duration >= settings.SLOW_REQUEST_SECONDS
+            or sample.query_count >= settings.SLOW_REQUEST_QUERIES
+        ):
+            log_slow_request(self.request, sample, self.capture)
+
+
+class Sample:
+    def __init__(self, request, response, duration, measurement, response_size):
+        match = request.resolver_match
+        self.view = match.view_name if match else "unmatched"
+        self.method = request.method
+        self.status = response.status_code
+        self.duration = duration
+        self.query_count = measurement.capture.count
+        self.db_time = measurement.capture.time
+        self.serializer_time = measurement.serializer_time
+        self.render_time = measurement.render_time
+        self.response_size = response_size
+
+
+class MeasuredStream:
+    """
+    Streaming content that is measured as it is sent, the sample is recorded
+    when the response closes it
+    """
+
+    def __init__(self, response, measurement):
+        self.response = response
+        self.measurement = measurement
+        self.parts = iter(response.streaming_content)
+        self.size = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.measurement.tracking():
+            part = next(self.parts)
+        self.size += len(part)
+        return part
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.measurement.finish(self.response, self.size)
+
+
+def timed_data(data):
+    """Serializer.data, adding its time to the request being measured"""
+
+    def get(serializer):
+        measurement = getattr(_state, "measurement", None)
+        # the outermost serializer only, nested ones are part of its time
+        if measurement is None or getattr(_state, "serializing", False):
+            return data.fget(serializer)
+        _state.serializing = True
+        start = perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            measurement.serializer_time += perf_counter() - start
+            _state.serializing = False
+
+    get.timed = True
+    return property(get)
+
+
+def instrument_serializers():
+    # the serializers build their data in the data property, views only read it
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, "timed", False):
+            cls.data = timed_data(cls.data)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        measurement = request._metrics = Measurement(request)
+        with measurement.tracking():
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = MeasuredStream(response, measurement)
+        else:
+            measurement.finish(response, len(response.content))
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF renders the serialized data right after this hook returns
+        started = perf_counter()
+
+        def rendered(response):
+            request._metrics.render_time = perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def log_slow_request(request, sample, capture):
+    statements = "\n".join(
+        f"  {elapsed * 1000:.1f}ms {sql}" for elapsed, sql in capture.captured
+    )
+    logging.warning(
+        f"Slow request {request.method} {request.path} ({sample.view}): "
+        f"{sample.duration * 1000:.1f}ms, {sample.query_count} queries "
+        f"in {sample.db_time * 1000:.1f}ms, {sample.response_size} bytes\n"
+        f"{statements}"
+    )
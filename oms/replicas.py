@@ -0,0 +1,97 @@
+"""
+Routing of read-only API requests to the read replicas in DATABASE_REPLICAS.
+
+Views opt in per action, see api.views.ReplicaReadMixin, and only then does
+ReplicaRouter send reads to a replica, every other read and every write goes
+to the default database. A user who writes is pinned to the default database
+for DATABASE_REPLICA_PIN_SECONDS so they read their own writes while the
+replicas catch up. Pins live in the default cache, a cache shared by the
+workers makes them hold across processes.
+"""
+import random
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS
+
+# the app label DatabaseCache gives its table's model
+CACHE_APP_LABEL = "django_cache"
+
+# same scope as django.db.connections, one request's threads and coroutines
+_state = Local()
+
+
+def pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def pin(user_id):
+    cache.set(pin_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def pinned(user_id):
+    return cache.get(pin_key(user_id), False)
+
+
+def read_from_replica(user):
+    """Send the rest of the current request's reads to a replica"""
+    if not settings.DATABASE_REPLICAS:
+        return
+    if user.is_authenticated and pinned(user.pk):
+        return
+    _state.alias = random.choice(settings.DATABASE_REPLICAS)
+
+
+def read_from_primary(**kwargs):
+    _state.alias = None
+
+
+def current_replica():
+    return getattr(_state, "alias", None)
+
+
+# streamed responses keep reading until the response is closed
+request_started.connect(read_from_primary)
+request_finished.connect(read_from_primary)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            # DatabaseCache entries, the cache versions and pins among them,
+            # are only current on the default database
+            return DEFAULT_DB_ALIAS
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        # an instance read from a replica is still saved to the default database
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the default database
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinMiddleware:
+    """Pin users to the default database after a request that may have written"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in ("GET", "HEAD", "OPTIONS", "TRACE")
+            and response.status_code < 400
+        ):
+            # DRF sets the user it authenticated on the Django request too
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                pin(user.pk)
+        return response
@@ -48,13 +48,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "oms.metrics.MetricsMiddleware",
+    # outside compression, so streamed bodies are compressed in the request's thread
+    "oms.spool.SpoolMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "oms.compression.CompressionMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "oms.replicas.ReplicaPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -83,7 +88,89 @@ WSGI_APPLICATION = "oms.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {"default": dj_database_url.parse(config("DATABASE_URL"), conn_max_age=600)}
+# Seconds a connection is kept open for reuse by later requests of the same thread
+DATABASE_CONN_MAX_AGE = config("DATABASE_CONN_MAX_AGE", default=600, cast=int)
+
+DATABASES = {
+    "default": dj_database_url.parse(
+        config("DATABASE_URL"), conn_max_age=DATABASE_CONN_MAX_AGE
+    )
+}
+
+# Read replicas of the default database, comma separated database URLs. The order
+# and item listings, order details and exports read from them, see oms.replicas.
+DATABASE_REPLICA_URLS = config(
+    "DATABASE_REPLICA_URLS",
+    default="",
+    cast=lambda v: [s.strip() for s in v.split(",") if s.strip()],
+)
+DATABASE_REPLICAS = []
+for number, url in enumerate(DATABASE_REPLICA_URLS, 1):
+    alias = f"replica{number}"
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=DATABASE_CONN_MAX_AGE)
+    # tests read the test database through the replicas
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["oms.replicas.ReplicaRouter"]
+
+# Seconds a user reads from the default database after writing, so they see their
+# own changes before the replicas do
+DATABASE_REPLICA_PIN_SECONDS = config(
+    "DATABASE_REPLICA_PIN_SECONDS", default=5, cast=int
+)
+
+# Connections of each database kept open by each process for its threads to share,
+# see oms.db.pool. Opt-in, the default 0 keeps Django's own per thread connections.
+DATABASE_POOL_SIZE = config("DATABASE_POOL_SIZE", default=0, cast=int)
+POOLED_ENGINES = {
+    "django.db.backends.postgresql": "oms.db.postgresql",
+    "django.db.backends.postgresql_psycopg2": "oms.db.postgresql",
+    "django.db.backends.sqlite3": "oms.db.sqlite3",
+}
+DATABASE_POOL = {
+    "SIZE": DATABASE_POOL_SIZE,
+    # opened when all SIZE are in use, closed as soon as they are returned
+    "MAX_OVERFLOW": config("DATABASE_POOL_MAX_OVERFLOW", default=10, cast=int),
+    # seconds to wait for a connection before failing the request
+    "TIMEOUT": config("DATABASE_POOL_TIMEOUT", default=30, cast=float),
+    "IDLE_TIMEOUT": config("DATABASE_POOL_IDLE_TIMEOUT", default=300, cast=float),
+    # test each connection with SELECT 1 before handing it out
+    "PRE_PING": config("DATABASE_POOL_PRE_PING", default=True, cast=bool),
+}
+if DATABASE_POOL_SIZE:
+    for database in DATABASES.values():
+        database.update(
+            ENGINE=POOLED_ENGINES[database["ENGINE"]],
+            # hand the connection back to the pool at the end of every request
+            CONN_MAX_AGE=0,
+            POOL=DATABASE_POOL,
+        )
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "db": "django.core.cache.backends.db.DatabaseCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+}
+
+# shared by every worker and management command, so a change made by one of them
+# is seen by all, locmem only suits a single process
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[config("CACHE_BACKEND", default="db")],
+        # table name for db (see `createcachetable` in run.sh), directory for file
+        "LOCATION": config("CACHE_LOCATION", default="oms_cache"),
+    }
+}
+
+# Seconds cached item listings and customer profiles are kept
+API_CACHE_TIMEOUT = config("API_CACHE_TIMEOUT", default=300, cast=int)
+# Seconds a cache version lives in a process-local cache (locmem), which never
+# hears of changes made by other processes. Shared caches keep versions until bumped.
+LOCAL_CACHE_VERSION_TIMEOUT = config("LOCAL_CACHE_VERSION_TIMEOUT", default=5, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -125,20 +212,41 @@ USE_TZ = True
 STATIC_URL = "static/"
 STATIC_ROOT = config("STATIC_ROOT", default="static")
 
+MEDIA_URL = "media/"
+MEDIA_ROOT = config("MEDIA_ROOT", default="media")
+
+# Receipts are rendered by `manage.py processreceipts`, clients poll until ready
+RECEIPT_POLL_INTERVAL = config("RECEIPT_POLL_INTERVAL", default=2, cast=int)
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+JSON_BACKENDS = {
+    "orjson": ("api.renderers.ORJSONRenderer", "api.renderers.ORJSONParser"),
+    "stdlib": (
+        "rest_framework.renderers.JSONRenderer",
+        "rest_framework.parsers.JSONParser",
+    ),
+}
+
+# Encoder of API requests and responses, one of JSON_BACKENDS
+JSON_BACKEND = config("JSON_BACKEND", default="orjson")
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
-    "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
-        "rest_framework.renderers.BrowsableAPIRenderer",
+    "DEFAULT_RENDERER_CLASSES": [JSON_BACKENDS[JSON_BACKEND][0]]
+    # the browsable API renders a full HTML page per request, keep it to development
+    + (["rest_framework.renderers.BrowsableAPIRenderer"] if DEBUG else []),
+    "DEFAULT_PARSER_CLASSES": [
+        JSON_BACKENDS[JSON_BACKEND][1],
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": config("PAGE_SIZE", default=10, cast=int),
@@ -154,6 +262,47 @@ REST_FRAMEWORK = {
 }
 
 
+# Compression of API responses, encodings in order of preference
+COMPRESS_ENCODINGS = ["br", "gzip"]
+COMPRESS_CONTENT_TYPES = ["application/json", "text/csv", "application/x-ndjson"]
+# Bodies smaller than this many bytes are sent as is
+COMPRESS_MIN_SIZE = config("COMPRESS_MIN_SIZE", default=1024, cast=int)
+COMPRESS_BROTLI_QUALITY = config("COMPRESS_BROTLI_QUALITY", default=5, cast=int)
+# Streamed bodies are flushed to the client after this many uncompressed bytes
+COMPRESS_FLUSH_SIZE = config("COMPRESS_FLUSH_SIZE", default=64 * 1024, cast=int)
+
+# List pages of at least this many rows are streamed, read STREAM_CHUNK_SIZE at a time
+STREAM_MIN_ROWS = config("STREAM_MIN_ROWS", default=500, cast=int)
+STREAM_CHUNK_SIZE = config("STREAM_CHUNK_SIZE", default=200, cast=int)
+
+# Rows fetched per round trip by order exports
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", default=2000, cast=int)
+
+# Records validated and written per transaction by imports, and errors reported
+IMPORT_BATCH_SIZE = config("IMPORT_BATCH_SIZE", default=1000, cast=int)
+IMPORT_MAX_ERRORS = config("IMPORT_MAX_ERRORS", default=1000, cast=int)
+
+# Seconds between keepalive comments on idle order event streams
+EVENTS_KEEPALIVE_SECONDS = config("EVENTS_KEEPALIVE_SECONDS", default=15, cast=int)
+# Seconds a ticket from order/events/ticket/ can be used to open an event stream
+EVENTS_TICKET_SECONDS = config("EVENTS_TICKET_SECONDS", default=30, cast=int)
+
+# Requests slower or chattier than this are logged with their SQL
+SLOW_REQUEST_SECONDS = config("SLOW_REQUEST_SECONDS", default=1.0, cast=float)
+SLOW_REQUEST_QUERIES = config("SLOW_REQUEST_QUERIES", default=50, cast=int)
+SLOW_REQUEST_MAX_QUERIES_LOGGED = config(
+    "SLOW_REQUEST_MAX_QUERIES_LOGGED", default=100, cast=int
+)
+
+# Seconds a worker may reuse a user's resolved roles before asking the database
+ROLE_CACHE_TIMEOUT = config("ROLE_CACHE_TIMEOUT", default=60, cast=int)
+
+# Seconds a worker trusts a token it looked up, see api.authentication
+TOKEN_CACHE_TIMEOUT = config("TOKEN_CACHE_TIMEOUT", default=60, cast=int)
+# Seconds an API token is valid after it is issued, 0 for tokens that never expire.
+# Opt-in, turning it on rejects every existing token older than this at once.
+TOKEN_EXPIRY_SECONDS = config("TOKEN_EXPIRY_SECONDS", default=0, cast=int)
+
 CORS_ALLOW_CREDENTIALS = True
 
 CORS_ORIGIN_WHITELIST = config(
@@ -0,0 +1,44 @@
+"""
+Streamed responses under ASGI. Django 4.0's ASGIHandler iterates a streaming
+response on the event loop, where the queries behind a streamed order page or
+export raise SynchronousOnlyOperation. SpoolMiddleware reads such a body while
+still in the request's thread into a temporary file, kept in memory up to
+spool_size bytes, and the file is what gets sent. Under WSGI it does nothing.
+"""
+import tempfile
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse
+
+
+def read_spool(spool, size):
+    with spool:
+        while True:
+            chunk = spool.read(size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class SpoolMiddleware:
+    spool_size = 1024 * 1024
+    read_size = 64 * 1024
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # files are safe to read on the event loop, their iterator makes no queries
+        if (
+            not isinstance(request, ASGIRequest)
+            or not response.streaming
+            or isinstance(response, FileResponse)
+        ):
+            return response
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        for part in response.streaming_content:
+            spool.write(part)
+        spool.seek(0)
+        response.streaming_content = read_spool(spool, self.read_size)
+        return response
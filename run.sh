@@ -1,5 +1,10 @@
 #! /bin/bash
 
+# Database connection pooling is opt-in: set DATABASE_POOL_SIZE (in backend.env
+# for docker-compose) to the connections each process keeps open, see
+# oms/settings.py for the other DATABASE_POOL_* settings. Unset or 0 keeps
+# Django's own per thread connections.
+
 python manage.py collectstatic --noinput
 python manage.py migrate
 python manage.py createcachetable